@@ -0,0 +1,118 @@
+import os
+import numpy as np
+
+# Optional inverted-file (IVF) index over the pattern embedding matrix. The rows are
+# clustered with spherical k-means; a query scores the cluster centroids and then only
+# the rows of its nprobe nearest clusters. nprobe is the recall/latency knob: more
+# probed lists means more rows scored and fewer missed neighbours (see bench_ann.py).
+ANN_INDEX = os.environ.get('ANN_INDEX', 'off')
+# Below this many rows the exact scan is already fast enough
+ANN_MIN_ROWS = int(os.environ.get('ANN_MIN_ROWS', '20000'))
+ANN_NPROBE = int(os.environ.get('ANN_NPROBE', '16'))
+# 0 picks sqrt(rows) lists
+ANN_LISTS = int(os.environ.get('ANN_LISTS', '0'))
+
+# Rows scored per block during k-means, bounds the (block x lists) score matrix
+ASSIGN_BLOCK = 8192
+
+class IVFIndex:
+    """
+    centroids:   (n_lists, dim) normalized float32 cluster centres
+    list_starts: offsets into row_ids, list i owns row_ids[list_starts[i]:list_starts[i + 1]]
+    row_ids:     rows of the embedding matrix sorted by cluster
+    """
+
+    def __init__(self, centroids, list_starts, row_ids, nprobe=ANN_NPROBE):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.list_starts = np.asarray(list_starts, dtype=np.int64)
+        self.row_ids = np.asarray(row_ids, dtype=np.int32)
+        self.nprobe = nprobe
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @property
+    def n_rows(self):
+        return len(self.row_ids)
+
+    def search(self, query, nprobe=None):
+        """Returns the ids of every row in the nprobe lists whose centroids are closest to query."""
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        centroid_scores = self.centroids @ query
+        if nprobe < self.n_lists:
+            probe = np.argpartition(centroid_scores, -nprobe)[-nprobe:]
+        else:
+            probe = np.arange(self.n_lists)
+        return np.concatenate([self.row_ids[self.list_starts[i]:self.list_starts[i + 1]] for i in probe])
+
+    def describe(self):
+        return {'kind': 'ivf', 'n_lists': self.n_lists, 'n_rows': self.n_rows, 'nprobe': self.nprobe}
+
+    def save(self, path):
+        np.savez(path, centroids=self.centroids, list_starts=self.list_starts, row_ids=self.row_ids)
+
+    @classmethod
+    def load(cls, path, nprobe=ANN_NPROBE):
+        with np.load(path) as parts:
+            return cls(parts['centroids'], parts['list_starts'], parts['row_ids'], nprobe=nprobe)
+
+def _assign(matrix, centroids):
+    """Index of the closest centroid for every row, scored block by block."""
+    labels = np.empty(len(matrix), dtype=np.int64)
+    for start in range(0, len(matrix), ASSIGN_BLOCK):
+        block = np.asarray(matrix[start:start + ASSIGN_BLOCK], dtype=np.float32)
+        labels[start:start + ASSIGN_BLOCK] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+def _group(labels, n_lists):
+    """(list_starts, row_ids) for rows grouped by label."""
+    row_ids = np.argsort(labels, kind='stable')
+    counts = np.bincount(labels, minlength=n_lists)
+    list_starts = np.concatenate(([0], np.cumsum(counts)))
+    return list_starts, row_ids
+
+def build_ivf(matrix, n_lists=None, iterations=8, train_size=64, seed=0, nprobe=ANN_NPROBE):
+    """
+    Spherical k-means over a normalized matrix. Centroids are trained on at most
+    train_size rows per list, then every row is assigned to its nearest centroid.
+    """
+    rng = np.random.default_rng(seed)
+    n_rows = len(matrix)
+    n_lists = n_lists or ANN_LISTS or max(1, int(np.sqrt(n_rows)))
+    n_lists = min(n_lists, n_rows)
+
+    sample_ids = rng.choice(n_rows, size=min(n_rows, n_lists * train_size), replace=False)
+    sample = np.asarray(matrix[np.sort(sample_ids)], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = _assign(sample, centroids)
+        list_starts, order = _group(labels, n_lists)
+        counts = np.diff(list_starts)
+        filled = counts > 0
+        sums = np.add.reduceat(sample[order], list_starts[:-1][filled], axis=0)
+        centroids[filled] = sums
+        # Empty lists restart from random sample rows instead of staying dead
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(len(sample), size=len(empty), replace=False)]
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids /= norms
+
+    list_starts, row_ids = _group(_assign(matrix, centroids), n_lists)
+    return IVFIndex(centroids, list_starts, row_ids, nprobe=nprobe)
+
+def with_ann(index, ivf=None):
+    """
+    Attaches an IVF index to an EmbeddingIndex when ANN_INDEX=ivf and the KB is large
+    enough; a prebuilt ivf (e.g. from the snapshot) is used if it matches the rows.
+    """
+    if ANN_INDEX != 'ivf' or len(index) < ANN_MIN_ROWS:
+        return index
+    if ivf is None or ivf.n_rows != len(index):
+        ivf = build_ivf(index.matrix)
+        print(f"Built IVF index ({ivf.n_lists} lists over {ivf.n_rows} rows)")
+    index.ann = ivf
+    return index
@@ -0,0 +1,89 @@
+import os
+import numpy as np
+from .embedding_codec import decode_embedding
+
+# Coarse-to-fine retrieval: the query is scored against one centroid per intent first,
+# then exactly against the patterns of the CENTROID_TOP_N best intents only.
+# 0 keeps the single-stage scan over every pattern.
+CENTROID_TOP_N = int(os.environ.get('CENTROID_TOP_N', '0'))
+
+class IntentCentroids:
+    """Normalized mean pattern vector of every intent, aligned with EmbeddingIndex.intent_tags."""
+
+    def __init__(self, matrix, top_n=CENTROID_TOP_N):
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self.top_n = top_n
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def search(self, query, top_n=None):
+        """Positions of the top_n intents whose centroids are closest to query."""
+        top_n = min(top_n or self.top_n, len(self.matrix))
+        scores = self.matrix @ query
+        if top_n < len(scores):
+            return np.argpartition(scores, -top_n)[-top_n:]
+        return np.arange(len(scores))
+
+def shift_centroid(mean, count, vector, sign=1):
+    """
+    Adds (sign=1) or removes (sign=-1) one pattern vector from an intent's running mean.
+    Vectors are normalized first so every pattern weighs the same as in the brain's index.
+    Returns (mean, count); mean is None once the last pattern is gone.
+    """
+    vector = np.asarray(vector, dtype=np.float64).ravel()
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector = vector / norm
+    total = vector * sign if mean is None else np.asarray(mean, dtype=np.float64) * count + vector * sign
+    count = count + sign
+    if count <= 0:
+        return None, 0
+    return total / count, count
+
+def compute_centroids(index, intents=None):
+    """Means of the (normalized) rows of each intent, straight from the index."""
+    ends = np.append(index.intent_starts[1:], len(index))
+    intents = range(len(index.intent_starts)) if intents is None else intents
+    matrix = np.zeros((len(intents), index.matrix.shape[1]), dtype=np.float32)
+    for row, i in enumerate(intents):
+        matrix[row] = index.dense(slice(index.intent_starts[i], ends[i])).mean(axis=0)
+    return matrix
+
+def stored_centroids(index, centroid_docs):
+    """
+    Centroid matrix for the index from the documents proxy.py maintains. An intent whose
+    stored count disagrees with its rows (an edit that raced, or a backfill that has not
+    rebuilt the centroids yet) is recomputed from the rows instead.
+    """
+    counts = np.diff(np.append(index.intent_starts, len(index)))
+    dim = index.matrix.shape[1]
+    by_tag = {doc['intent_tag']: doc for doc in centroid_docs}
+
+    matrix = np.zeros((len(index.intent_tags), dim), dtype=np.float32)
+    stale = []
+    for i, tag in enumerate(index.intent_tags):
+        doc = by_tag.get(tag)
+        vector = decode_embedding(doc['embedding']) if doc and doc.get('count') == counts[i] else None
+        if vector is None or len(vector) != dim:
+            stale.append(i)
+        else:
+            matrix[i] = vector
+    if stale:
+        matrix[stale] = compute_centroids(index, stale)
+    return matrix
+
+def with_centroids(index, centroid_docs=None, matrix=None):
+    """
+    Attaches IntentCentroids to an EmbeddingIndex when CENTROID_TOP_N is set and there are
+    more intents than that. matrix (e.g. from the snapshot) is used as-is; otherwise the
+    centroids come from centroid_docs, falling back to the rows.
+    """
+    if CENTROID_TOP_N <= 0 or len(index.intent_tags) <= CENTROID_TOP_N:
+        return index
+    if matrix is None or len(matrix) != len(index.intent_tags):
+        matrix = stored_centroids(index, centroid_docs or [])
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    index.centroids = IntentCentroids(matrix / norms)
+    return index
@@ -0,0 +1,112 @@
+import os
+import time
+import threading
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitOpenError(Exception):
+    """The call was not attempted because its circuit is open."""
+
+class CircuitBreaker:
+    """
+    Stops calling a dependency that keeps failing. Closed: calls go through and
+    failure_threshold consecutive failures open the circuit (a trip=True failure, such as
+    a 429 or an exhausted balance, opens it at once). Open: calls are refused for cooldown
+    seconds, or the server's Retry-After if longer. Half-open: up to half_open_probes
+    calls test the dependency; a success closes the circuit and a failure reopens it.
+    Every transition is printed so it shows up in the function logs.
+    """
+
+    def __init__(self, name, failure_threshold=3, cooldown=30.0, half_open_probes=1, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.half_open_probes = half_open_probes
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.open_for = cooldown
+        self.probes = 0
+        self.stats = {'calls': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, name, prefix='BREAKER'):
+        return cls(
+            name,
+            failure_threshold=int(os.environ.get(f'{prefix}_FAILURE_THRESHOLD', '3')),
+            cooldown=float(os.environ.get(f'{prefix}_COOLDOWN', '30')),
+            half_open_probes=int(os.environ.get(f'{prefix}_HALF_OPEN_PROBES', '1'))
+        )
+
+    def _transition(self, state, reason):
+        print(f"Circuit '{self.name}': {self.state} -> {state} ({reason})")
+        self.state = state
+        if state == OPEN:
+            self.opened_at = self.clock()
+            self.stats['opened'] += 1
+        if state != HALF_OPEN:
+            self.probes = 0
+
+    def _cooled_down(self):
+        return self.clock() - self.opened_at >= self.open_for
+
+    def is_open(self):
+        """True while calls would be refused; lets callers skip the dependency up front."""
+        with self._lock:
+            if self.state == OPEN:
+                return not self._cooled_down()
+            return self.state == HALF_OPEN and self.probes >= self.half_open_probes
+
+    def allow(self):
+        """Claims permission for one call; every allowed call must be followed by record_*()."""
+        with self._lock:
+            if self.state == OPEN and self._cooled_down():
+                self._transition(HALF_OPEN, f'{self.open_for:g}s cooldown over')
+            if self.state == CLOSED or (self.state == HALF_OPEN and self.probes < self.half_open_probes):
+                self.stats['calls'] += 1
+                if self.state == HALF_OPEN:
+                    self.probes += 1
+                return True
+            self.stats['rejected'] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self.state == HALF_OPEN:
+                self._transition(CLOSED, 'probe succeeded')
+
+    def record_failure(self, reason, trip=False, retry_after=None):
+        with self._lock:
+            self.stats['failures'] += 1
+            self.failures += 1
+            if self.state == OPEN:
+                return
+            if self.state == HALF_OPEN or trip or self.failures >= self.failure_threshold:
+                self.open_for = max(self.cooldown, retry_after or 0)
+                self._transition(OPEN, f'{reason}; retry in {self.open_for:g}s')
+
+    def call(self, fn, *args, classify=None, **kwargs):
+        """
+        Runs fn through the breaker: raises CircuitOpenError without calling it while open.
+        classify(exception) -> (reason, trip, retry_after) describes a failure; by default
+        the message, counted towards failure_threshold.
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit '{self.name}' is open")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            reason, trip, retry_after = classify(e) if classify else (str(e) or type(e).__name__, False, None)
+            self.record_failure(reason, trip=trip, retry_after=retry_after)
+            raise
+        self.record_success()
+        return result
+
+    def describe(self):
+        with self._lock:
+            return dict(self.stats, state=self.state, consecutive_failures=self.failures)
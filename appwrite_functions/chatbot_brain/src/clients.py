@@ -0,0 +1,97 @@
+import os
+import threading
+from http.cookiejar import DefaultCookiePolicy
+import requests
+from requests.adapters import HTTPAdapter
+import appwrite.client
+from appwrite.client import Client
+from appwrite.services.databases import Databases
+from .nlp_engine import get_embedding_provider
+
+# Clients shared by every warm invocation of this process, created on first use and keyed
+# by endpoint/project/key (or backend/token/endpoint), so a rotated key gets a fresh one.
+#
+# The Appwrite SDK sends each API call through requests.request(), which opens (and
+# closes) a new session: every call pays a TCP + TLS handshake even with a reused Client.
+# install_pool() routes those calls through one keep-alive Session instead. Its cookie jar
+# accepts nothing, keeping calls as stateless as before: a login's session cookie must
+# never ride along on another request. huggingface_hub already keeps its own pooled
+# client, so reusing the provider is enough on that side.
+
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '16'))
+
+_lock = threading.Lock()
+_clients = {}
+_databases = {}
+_providers = {}
+_pool = {'session': None}
+
+class PooledRequests:
+    """Stands in for the requests module inside appwrite.client; request() uses session."""
+
+    def __init__(self, session):
+        self.session = session
+
+    def request(self, method, url, **kwargs):
+        return self.session.request(method, url, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+def make_session(pool_size=None):
+    session = requests.Session()
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size or HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def install_pool(session=None):
+    """Makes every Appwrite SDK call in this process reuse pooled connections."""
+    with _lock:
+        if _pool['session'] is None or session is not None:
+            _pool['session'] = session or make_session()
+            appwrite.client.requests = PooledRequests(_pool['session'])
+        return _pool['session']
+
+def uninstall_pool():
+    """Back to one connection per call (for comparisons)."""
+    with _lock:
+        if _pool['session'] is not None:
+            _pool['session'].close()
+            _pool['session'] = None
+        appwrite.client.requests = requests
+
+def get_client(endpoint, project, key=None):
+    install_pool()
+    cache_key = (endpoint, project, key)
+    with _lock:
+        client = _clients.get(cache_key)
+        if client is None:
+            client = Client().set_endpoint(endpoint).set_project(project)
+            if key:
+                client.set_key(key)
+            _clients[cache_key] = client
+        return client
+
+def get_databases(endpoint, project, key=None):
+    cache_key = (endpoint, project, key)
+    with _lock:
+        databases = _databases.get(cache_key)
+    if databases is None:
+        databases = Databases(get_client(endpoint, project, key))
+        with _lock:
+            databases = _databases.setdefault(cache_key, databases)
+    return databases
+
+def get_provider(backend=None, token=None, timeout=None):
+    """get_embedding_provider(), built once per backend/token/endpoint/timeout."""
+    backend = (backend or os.environ.get('EMBEDDING_BACKEND', 'hf')).lower()
+    cache_key = (backend, token, os.environ.get('HF_ENDPOINT_URL'), timeout)
+    with _lock:
+        provider = _providers.get(cache_key)
+    if provider is None:
+        provider = get_embedding_provider(backend, token, timeout)
+        with _lock:
+            provider = _providers.setdefault(cache_key, provider)
+    return provider
@@ -0,0 +1,81 @@
+import base64
+import json
+import numpy as np
+
+# Stored format: "emb1:<dtype>:<dim>:<base64 little-endian bytes>"
+# Legacy documents hold a json.dumps() list of floats and are still decoded.
+FORMAT_PREFIX = 'emb1'
+DTYPES = {
+    'f16': np.dtype('<f2'),
+    'f32': np.dtype('<f4'),
+}
+DEFAULT_DTYPE = 'f16'
+
+def encode_embedding(vector, dtype=DEFAULT_DTYPE):
+    if dtype == 'json':
+        return json.dumps([float(x) for x in vector])
+    array = np.asarray(vector, dtype=DTYPES[dtype]).ravel()
+    payload = base64.b64encode(array.tobytes()).decode('ascii')
+    return f"{FORMAT_PREFIX}:{dtype}:{array.shape[0]}:{payload}"
+
+def is_binary(text):
+    return text.startswith(FORMAT_PREFIX + ':')
+
+def parse_header(text):
+    _, dtype, dim, payload = text.split(':', 3)
+    return dtype, int(dim), payload
+
+def decode_embedding(text):
+    if is_binary(text):
+        dtype, dim, payload = parse_header(text)
+        array = np.frombuffer(base64.b64decode(payload), dtype=DTYPES[dtype])
+        if array.shape[0] != dim:
+            raise ValueError(f"Embedding declares {dim} dims but holds {array.shape[0]}")
+        return array.astype(np.float32)
+    return np.asarray(json.loads(text), dtype=np.float32)
+
+def decode_embeddings(texts):
+    """
+    Decodes a page of stored embeddings into one float32 matrix.
+    Binary rows are base64-decoded, joined and reinterpreted with a single frombuffer
+    per dtype; only legacy JSON rows go through json.loads.
+    Returns (matrix, kept) where kept lists the input positions that decoded cleanly.
+    """
+    groups = {}
+    for i, text in enumerate(texts):
+        try:
+            if is_binary(text):
+                dtype, dim, payload = parse_header(text)
+                raw = base64.b64decode(payload)
+                if len(raw) != dim * DTYPES[dtype].itemsize:
+                    continue
+            else:
+                dtype, raw = 'json', np.asarray(json.loads(text), dtype=np.float32)
+                dim = raw.shape[0]
+            positions, chunks = groups.setdefault((dtype, dim), ([], []))
+            positions.append(i)
+            chunks.append(raw)
+        except Exception:
+            continue
+
+    if not groups:
+        return np.zeros((0, 0), dtype=np.float32), []
+
+    # A collection should hold one model; if it doesn't, keep the most common dimension
+    row_counts = {}
+    for (dtype, dim), (positions, _) in groups.items():
+        row_counts[dim] = row_counts.get(dim, 0) + len(positions)
+    dim = max(row_counts, key=row_counts.get)
+
+    kept = sorted(i for (_, d), (positions, _) in groups.items() if d == dim for i in positions)
+    row_of = {pos: row for row, pos in enumerate(kept)}
+    matrix = np.empty((len(kept), dim), dtype=np.float32)
+    for (dtype, d), (positions, chunks) in groups.items():
+        if d != dim:
+            continue
+        if dtype == 'json':
+            block = np.stack(chunks)
+        else:
+            block = np.frombuffer(b''.join(chunks), dtype=DTYPES[dtype]).reshape(len(chunks), dim)
+        matrix[[row_of[p] for p in positions]] = block
+    return matrix, kept
@@ -0,0 +1,205 @@
+import os
+import time
+import threading
+from appwrite.query import Query
+from .nlp_engine import build_embedding_index, quantize_index, BowIndex
+from .snapshot import load_snapshot
+from .ann_index import with_ann
+from .centroids import CENTROID_TOP_N, with_centroids
+from .prefilter import with_prefilter
+from .projection import with_projection
+from .kb_loader import iter_documents, list_all_documents
+from .timing import stage, record, TimedIterator
+
+# How long a warm container trusts its cached indexes before re-checking the KB version
+KB_CHECK_INTERVAL = float(os.environ.get('KB_CHECK_INTERVAL', '15'))
+# Settings (threshold + the KB version marker) and responses change a few times a term
+SETTINGS_TTL = float(os.environ.get('SETTINGS_TTL', '60'))
+RESPONSES_TTL = float(os.environ.get('RESPONSES_TTL', '300'))
+
+# Settings document bumped by proxy.py on every admin write to the KB
+KB_VERSION_KEY = 'kb_version'
+
+# Module-level state survives across warm invocations of the same container
+_index_cache = {}
+_settings_cache = {'values': None, 'loaded_at': 0.0}
+_responses_cache = {}
+_kb_marker = {'value': None}
+# Bumped by invalidate(); a load that started before an invalidation is served but not cached
+_generation = {'value': 0}
+_snapshot = {'loaded': False, 'value': None}
+_settings_lock = threading.Lock()
+_index_locks = {}
+
+def get_kb_version(databases, db_id, collection, filters=()):
+    """
+    Cheap fingerprint of a collection: document count plus the newest $updatedAt.
+    Adds, edits and deletes through the admin panel all change one of the two.
+    Only used when the settings collection has no kb_version marker.
+    """
+    resp = databases.list_documents(db_id, collection, [
+        *filters,
+        Query.order_desc('$updatedAt'),
+        Query.limit(1),
+        Query.select(['$id', '$updatedAt'])
+    ])
+    latest = resp['documents'][0]['$updatedAt'] if resp['documents'] else None
+    return f"{resp['total']}:{latest}"
+
+def get_settings(databases, db_id, collection='settings'):
+    """
+    Read-through cache of the whole settings collection as {key: value}.
+    A changed kb_version marker drops every cached index and response map.
+    """
+    if _settings_cache['values'] is not None and time.monotonic() - _settings_cache['loaded_at'] < SETTINGS_TTL:
+        return _settings_cache['values']
+
+    # Concurrent prefetch tasks wait for one load instead of each reading the collection
+    with _settings_lock:
+        now = time.monotonic()
+        if _settings_cache['values'] is not None and now - _settings_cache['loaded_at'] < SETTINGS_TTL:
+            return _settings_cache['values']
+
+        with stage('settings_fetch'):
+            documents = iter_documents(databases, db_id, collection, select=['key', 'value'])
+            values = {doc['key']: doc['value'] for doc in documents}
+        marker = values.get(KB_VERSION_KEY)
+        # On the very first load nothing cached predates the marker, so there is nothing to drop
+        if marker != _kb_marker['value'] and _settings_cache['values'] is not None:
+            print(f"KB version changed ({_kb_marker['value']} -> {marker}), invalidating caches")
+            invalidate()
+        _kb_marker['value'] = marker
+
+        _settings_cache['values'] = values
+        _settings_cache['loaded_at'] = now
+        return values
+
+def get_snapshot():
+    if not _snapshot['loaded']:
+        _snapshot['value'] = load_snapshot()
+        _snapshot['loaded'] = True
+    return _snapshot['value']
+
+def _from_snapshot(collection, part):
+    """Returns part(snapshot) when the bundled snapshot matches the live KB version, else None."""
+    snapshot = get_snapshot()
+    marker = _kb_marker['value']
+    if snapshot is None or marker is None or snapshot.version != marker:
+        return None
+    if collection not in snapshot.collections.values():
+        return None
+    return part(snapshot)
+
+def _fresh_index(key):
+    entry = _index_cache.get(key)
+    # With a kb_version marker, get_settings() already evicted anything stale
+    if entry and (_kb_marker['value'] is not None or time.monotonic() - entry['checked_at'] < KB_CHECK_INTERVAL):
+        return entry['index']
+    return None
+
+def _get_cached_index(databases, db_id, collection, build, filters=(), snapshot_part=None, select=None):
+    key = (db_id, collection, tuple(filters))
+    index = _fresh_index(key)
+    if index is not None:
+        return index
+
+    # One loader per index: a prefetch still running from an earlier request is joined, not repeated
+    with _index_locks.setdefault(key, threading.Lock()):
+        index = _fresh_index(key)
+        if index is not None:
+            return index
+        return _load_index(databases, db_id, collection, build, filters, snapshot_part, select, key)
+
+def _load_index(databases, db_id, collection, build, filters, snapshot_part, select, key):
+    entry = _index_cache.get(key)
+    now = time.monotonic()
+    marker = _kb_marker['value']
+    if marker is not None:
+        version = marker
+    else:
+        try:
+            with stage('kb_version_check'):
+                version = get_kb_version(databases, db_id, collection, filters)
+        except Exception as e:
+            if entry:
+                print(f"KB version check failed, serving cached {collection} index: {e}")
+                entry['checked_at'] = now
+                return entry['index']
+            raise
+
+        if entry and entry['version'] == version:
+            entry['checked_at'] = now
+            return entry['index']
+
+    generation = _generation['value']
+    with stage(f'{collection}_snapshot'):
+        index = _from_snapshot(collection, snapshot_part) if snapshot_part else None
+    if index is not None:
+        print(f"Loaded {collection} index from snapshot ({len(index)} patterns, version {version})")
+    else:
+        # Pages stream straight into the builder; only the attributes it reads are fetched
+        pages = TimedIterator(iter_documents(databases, db_id, collection, filters, select=select),
+                              f'{collection}_download')
+        start = time.perf_counter()
+        index = build(pages)
+        # Decoding and index construction, without the time spent waiting for pages
+        record(f'{collection}_build', (time.perf_counter() - start) * 1000 - pages.elapsed_ms)
+        print(f"Rebuilt {collection} index ({len(index)} patterns, version {version})")
+    if generation == _generation['value']:
+        _index_cache[key] = {'version': version, 'index': index, 'checked_at': now}
+    return index
+
+def load_centroid_docs(databases, db_id, collection, model_id):
+    """Per-intent centroids kept up to date by proxy.py; empty if the collection is unavailable."""
+    filters = [Query.equal('model', model_id)] if model_id else []
+    try:
+        return list_all_documents(databases, db_id, collection, filters, select=['intent_tag', 'embedding', 'count'])
+    except Exception as e:
+        print(f"Centroids unavailable, computing them from the patterns: {e}")
+        return []
+
+def get_embedding_index(databases, db_id, collection='embeddings', model_id=None, centroid_collection='centroids'):
+    # Only vectors from the active embedding backend are comparable with its queries
+    filters = (Query.equal('model', model_id),) if model_id else ()
+    def build(docs):
+        # Live loads build the IVF lists in the container; snapshots ship them prebuilt
+        index = with_ann(build_embedding_index(docs))
+        index = with_prefilter(index, texts=index.texts)
+        if CENTROID_TOP_N > 0:
+            index = with_centroids(index, load_centroid_docs(databases, db_id, centroid_collection, model_id))
+        return quantize_index(with_projection(index))
+    def snapshot_part(snapshot):
+        return snapshot.embedding_index() if snapshot.model_id == model_id else None
+    select = ['intent_tag', 'embedding', 'pattern_text']
+    return _get_cached_index(databases, db_id, collection, build, filters, snapshot_part, select)
+
+def get_bow_index(databases, db_id, collection='patterns'):
+    return _get_cached_index(databases, db_id, collection, BowIndex,
+                             snapshot_part=lambda snapshot: snapshot.bow_index(), select=['text', 'intent_tag'])
+
+def has_bow_index(db_id, collection='patterns'):
+    """True once this process has loaded the BoW index, i.e. get_bow_index() won't block on a full load."""
+    return (db_id, collection, ()) in _index_cache
+
+def get_response_map(databases, db_id, collection):
+    """Intent -> [response text] map loaded page by page and kept for RESPONSES_TTL."""
+    key = (db_id, collection)
+    entry = _responses_cache.get(key)
+    now = time.monotonic()
+    if entry is None or now - entry['loaded_at'] >= RESPONSES_TTL:
+        generation = _generation['value']
+        by_intent = _from_snapshot(collection, lambda snapshot: snapshot.response_map())
+        if by_intent is None:
+            by_intent = {}
+            with stage(f'{collection}_download'):
+                for doc in iter_documents(databases, db_id, collection, select=['text', 'intent_tag']):
+                    by_intent.setdefault(doc['intent_tag'], []).append(doc['text'])
+        entry = {'by_intent': by_intent, 'loaded_at': now}
+        if generation == _generation['value']:
+            _responses_cache[key] = entry
+    return entry['by_intent']
+
+def invalidate():
+    _generation['value'] += 1
+    _index_cache.clear()
+    _responses_cache.clear()
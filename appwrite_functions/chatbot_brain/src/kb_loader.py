@@ -0,0 +1,34 @@
+import os
+from appwrite.query import Query
+
+# Documents per list_documents call; every page after the first continues from the
+# last $id seen, so nothing beyond a fixed limit is silently dropped
+KB_PAGE_SIZE = int(os.environ.get('KB_PAGE_SIZE', '1000'))
+
+def iter_pages(databases, db_id, collection, queries=(), select=None, page_size=None):
+    """
+    Yields every matching document of a collection one page (list) at a time.
+    select: the attributes to fetch; '$id' is always added since the cursor needs it.
+    """
+    page_size = page_size or KB_PAGE_SIZE
+    page_queries = [*queries, Query.limit(page_size)]
+    if select:
+        page_queries.append(Query.select(['$id', *[a for a in select if a != '$id']]))
+
+    cursor = None
+    while True:
+        cursor_query = [Query.cursor_after(cursor)] if cursor else []
+        documents = databases.list_documents(db_id, collection, page_queries + cursor_query)['documents']
+        if documents:
+            yield documents
+        if len(documents) < page_size:
+            return
+        cursor = documents[-1]['$id']
+
+def iter_documents(databases, db_id, collection, queries=(), select=None, page_size=None):
+    """Streams every matching document; only one page is held in memory at a time."""
+    for page in iter_pages(databases, db_id, collection, queries, select, page_size):
+        yield from page
+
+def list_all_documents(databases, db_id, collection, queries=(), select=None, page_size=None):
+    return list(iter_documents(databases, db_id, collection, queries, select, page_size))
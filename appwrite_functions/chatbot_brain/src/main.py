@@ -1,31 +1,200 @@
 import os
 import random
 import json
-from appwrite.client import Client
-from appwrite.services.databases import Databases
-from appwrite.query import Query
-from .nlp_engine import get_hf_client, get_query_embedding, predict_intent_semantic, predict_intent_bow
+from concurrent.futures import ThreadPoolExecutor
+from .clients import get_databases, get_provider
+from .nlp_engine import (brain_timeout, guard_provider, get_query_embedding, get_query_embeddings,
+                         predict_intent_semantic, predict_intents_semantic, predict_intent_bow, bow_margin)
+from .circuit_breaker import CircuitBreaker
+from .kb_cache import get_settings, get_embedding_index, get_bow_index, has_bow_index, get_response_map
+from .query_cache import QueryEmbeddingCache
+from .query_log import QueryLogger
+from .timing import StageTimer, LatencyStats, stage
+
+# Shared by every warm invocation of this container
+query_cache = QueryEmbeddingCache.from_env()
+# Collections created before timings were logged reject the attribute until setup_appwrite.py re-runs
+query_logger = QueryLogger.from_env(optional_fields=('timings',))
+# Opens after repeated HF failures (or at once on a 429 / exhausted balance); while open,
+# requests skip the embedding call and answer with Bag of Words
+embedding_breaker = CircuitBreaker.from_env('embedding')
+# Runs the independent I/O of a request (embedding call, KB loads) side by side
+io_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('BRAIN_IO_WORKERS', '4')), thread_name_prefix='brain-io')
+
+# 'bow_first' answers from the local BoW index when its match is confident and clearly
+# ahead of the runner-up, skipping the remote embedding call; 'semantic_first' (default)
+# always embeds. Derive the bars with calibrate_cascade.py from real query logs before
+# turning bow_first on: the defaults only reflect the patterns in data/intents.json.
+CASCADE = os.environ.get('CASCADE', 'semantic_first')
+BOW_FIRST_CONFIDENCE = float(os.environ.get('BOW_FIRST_CONFIDENCE', '0.75'))
+BOW_FIRST_MARGIN = float(os.environ.get('BOW_FIRST_MARGIN', '0.15'))
+cascade_stats = {'requests': 0, 'semantic_skipped': 0}
+
+# Largest {"messages": [...]} payload answered in one execution
+BATCH_MAX_MESSAGES = int(os.environ.get('BATCH_MAX_MESSAGES', '500'))
+
+# Per-stage timings go into every log record; DEBUG_TIMINGS=1 (or "debug": true in the
+# payload) also returns them, with this instance's p50/p95/p99 rollup, in the response
+DEBUG_TIMINGS = os.environ.get('DEBUG_TIMINGS', '') == '1'
+latency_stats = LatencyStats(window=int(os.environ.get('LATENCY_WINDOW', '1000')))
+LATENCY_LOG_EVERY = 100
+
+NO_RESPONSE = "I found the intent but have no response configured."
+NOT_UNDERSTOOD = "I'm sorry, I didn't quite understand that. Could you please rephrase your question about NWU?"
+
+def load_settings_and_index(databases, db_id, coll_settings, coll_embeddings, model_id):
+    # Settings first: a changed KB version marker must evict the index before it is read
+    settings, settings_error = {}, None
+    try:
+        settings = get_settings(databases, db_id, coll_settings)
+    except Exception as e:
+        settings_error = e
+    return settings, settings_error, get_embedding_index(databases, db_id, coll_embeddings, model_id)
+
+def prefetch_after_settings(databases, db_id, coll_settings, load, *args):
+    # The KB version marker in settings decides whether the bundled snapshot can be used
+    try:
+        get_settings(databases, db_id, coll_settings)
+    except Exception:
+        pass
+    return load(databases, db_id, *args)
+
+def embed_message(message, embedding_provider):
+    with stage('embedding'):
+        return get_query_embedding(message, embedding_provider, query_cache)
+
+def finish_timing(context, timer):
+    """Adds the request's timings to the instance rollup; logs the rollup now and then."""
+    timings = timer.as_dict()
+    latency_stats.record(timings)
+    if latency_stats.requests % LATENCY_LOG_EVERY == 0:
+        context.log(f"Latency percentiles (ms): {latency_stats.percentiles()}")
+    return timings
+
+def pick_response(response_map, intent_tag):
+    """Returns (response text, matched) for a predicted intent (or None)."""
+    if not intent_tag:
+        return NOT_UNDERSTOOD, False
+    responses = response_map.get(intent_tag, [])
+    if responses:
+        return random.choice(responses), True
+    return NO_RESPONSE, False
+
+def bow_first_match(message, bow_index, threshold):
+    """(tag, score) when the BoW-first cascade may answer message without embedding it, else None."""
+    tag, score, lead = bow_margin(message, bow_index)
+    if tag and score >= max(BOW_FIRST_CONFIDENCE, threshold) and lead >= BOW_FIRST_MARGIN:
+        return tag, score
+    return None
+
+def answer_batch(context, messages, embedding_provider, databases, db_id, colls, timer):
+    """
+    Answers many messages in one execution: the BoW-first cascade per message, one batched
+    embedding call for the rest, one matrix-matrix product to score them and one bulk log write.
+    """
+    kb_future = io_pool.submit(timer.bind(load_settings_and_index), databases, db_id, colls['settings'],
+                               colls['embeddings'], embedding_provider.model_id)
+    bow_future = io_pool.submit(timer.bind(prefetch_after_settings), databases, db_id, colls['settings'],
+                                get_bow_index, colls['patterns'])
+    responses_future = io_pool.submit(timer.bind(prefetch_after_settings), databases, db_id, colls['settings'],
+                                      get_response_map, colls['responses'])
+
+    settings, settings_error, embedding_index = {}, None, None
+    try:
+        with stage('kb_wait'):
+            settings, settings_error, embedding_index = kb_future.result()
+    except Exception as e:
+        context.error(f"Embedding index fetch error: {e}")
+    if settings_error:
+        context.error(f"Settings fetch error: {settings_error}")
+    threshold = float(settings.get('threshold', 0.5))
+    with stage('bow_index_wait'):
+        bow_index = bow_future.result()
+
+    results = [{'intent': None, 'confidence': 0, 'method': 'none'} for _ in messages]
+    pending = list(range(len(messages)))
+    if CASCADE == 'bow_first':
+        pending = []
+        with stage('bow_first'):
+            for i, message in enumerate(messages):
+                match = bow_first_match(message, bow_index, threshold)
+                if match:
+                    results[i].update(intent=match[0], confidence=match[1], method='bow_fast')
+                else:
+                    pending.append(i)
+    cascade_stats['requests'] += len(messages)
+    cascade_stats['semantic_skipped'] += len(messages) - len(pending)
+
+    if pending and embedding_index is not None and not embedding_breaker.is_open():
+        with stage('embedding'):
+            vectors = get_query_embeddings([messages[i] for i in pending], embedding_provider, query_cache)
+        with stage('semantic_scoring'):
+            predictions = predict_intents_semantic(vectors, embedding_index, threshold=threshold)
+        for i, vector, (tag, score, _) in zip(pending, vectors, predictions):
+            if vector is not None:
+                results[i].update(intent=tag, confidence=score, method='semantic')
+
+    with stage('responses_wait'):
+        response_map = responses_future.result()
+    with stage('bow_fallback'):
+        for message, result in zip(messages, results):
+            if not result['intent']:
+                tag, score = predict_intent_bow(message, bow_index, threshold=threshold)
+                result.update(intent=tag, confidence=score, method='bow')
+
+    timings = json.dumps(timer.as_dict(), separators=(',', ':'))
+    records = []
+    for message, result in zip(messages, results):
+        final_response, matched = pick_response(response_map, result['intent'])
+        result['message'] = final_response
+        records.append({
+            'query': message,
+            'response': final_response,
+            'intent_tag': result['intent'] or 'unknown',
+            'matched': matched,
+            'timings': timings
+        })
+    with stage('log_write'):
+        query_logger.log_many(records)
+
+    methods = {}
+    for result in results:
+        methods[result['method']] = methods.get(result['method'], 0) + 1
+    context.log(f"Batch of {len(messages)} | Methods: {methods} | Cascade: {cascade_stats}")
+    return [dict(result, query=message) for message, result in zip(messages, results)]
 
 def main(context):
-    # Appwrite Setup
-    client = Client()
-    client.set_endpoint(os.environ.get('APPWRITE_ENDPOINT', 'https://fra.cloud.appwrite.io/v1'))
-    client.set_project(os.environ.get('APPWRITE_PROJECT_ID', '6953d25b0006cc1ceea5'))
-    client.set_key(os.environ.get('APPWRITE_API_KEY'))
-    
-    hf_token = os.environ.get('HF_API_TOKEN')
-    hf_client = get_hf_client(hf_token)
-    
-    databases = Databases(client)
-    
+    timer = StageTimer()
+    with timer.active():
+        return handle(context, timer)
+
+def handle(context, timer):
+    # Appwrite Setup: the client and its pooled connections outlive the request
+    databases = get_databases(os.environ.get('APPWRITE_ENDPOINT', 'https://fra.cloud.appwrite.io/v1'),
+                              os.environ.get('APPWRITE_PROJECT_ID', '6953d25b0006cc1ceea5'),
+                              os.environ.get('APPWRITE_API_KEY'))
+
+    # EMBEDDING_BACKEND selects HuggingFace ('hf') or the local CPU embedder ('local')
+    embedding_provider = guard_provider(get_provider(token=os.environ.get('HF_API_TOKEN'), timeout=brain_timeout()),
+                                        embedding_breaker)
+
     db_id = os.environ.get('APPWRITE_DATABASE_ID', 'nwu_chatbot_db')
     coll_embeddings = 'embeddings'
     coll_patterns = 'patterns'
     coll_responses = os.environ.get('APPWRITE_COLLECTION_RESPONSES', 'responses')
     coll_settings = 'settings'
     coll_logs = 'logs'
+    query_logger.bind(databases, db_id, coll_logs)
 
     try:
+        # Scheduled runs ship the logs spooled by earlier requests
+        if context.req.headers.get('x-appwrite-trigger') == 'schedule':
+            shipped = query_logger.ship_spool()
+            context.log(f"Shipped {shipped} spooled logs | Logger stats: {query_logger.stats}")
+            context.log(f"Latency percentiles (ms): {latency_stats.percentiles()}")
+            context.log(f"Embedding circuit: {embedding_breaker.describe()}")
+            return context.res.json({"shipped_logs": shipped})
+
         # 1. Parse Input
         if context.req.body:
             payload = json.loads(context.req.body)
@@ -33,68 +202,144 @@ def main(context):
         else:
             return context.res.json({"error": "No message provided"}, 400)
 
+        # Batch payload: {"messages": [...]} answered together, results in the same order
+        if 'messages' in payload:
+            messages = payload['messages']
+            if not isinstance(messages, list) or not all(isinstance(m, str) and m for m in messages):
+                return context.res.json({"error": "messages must be a list of non-empty strings"}, 400)
+            if len(messages) > BATCH_MAX_MESSAGES:
+                return context.res.json({"error": f"At most {BATCH_MAX_MESSAGES} messages per batch"}, 400)
+            colls = {'embeddings': coll_embeddings, 'patterns': coll_patterns,
+                     'responses': coll_responses, 'settings': coll_settings}
+            results = answer_batch(context, messages, embedding_provider, databases, db_id, colls, timer)
+            timings = finish_timing(context, timer)
+            if payload.get('debug') or DEBUG_TIMINGS:
+                return context.res.json({"results": results, "timings": timings,
+                                         "latency": latency_stats.percentiles()})
+            return context.res.json({"results": results})
+
         if not user_msg:
             return context.res.json({"error": "Empty message"}, 400)
 
-        # 2. Fetch Threshold from Settings
-        threshold = 0.5
-        try:
-            settings_resp = databases.list_documents(db_id, coll_settings, [Query.equal('key', 'threshold')])
-            if settings_resp['documents']:
-                threshold = float(settings_resp['documents'][0]['value'])
-        except Exception as e:
-            context.error(f"Settings fetch error: {e}")
+        # 2. Start the settings + KB load and speculative prefetches of the BoW index and
+        # responses at once; on a warm container they finish immediately from cache. Unless
+        # the BoW-first cascade may skip it, the remote embedding call starts right away too
+        # (with bow_first, only when the BoW index has yet to be loaded)
+        # Pool threads record their stages (fetches, index builds) into this request's timer
+        def submit(fn, *args):
+            return io_pool.submit(timer.bind(fn), *args)
+
+        def start_embedding():
+            return submit(embed_message, user_msg, embedding_provider)
+
+        semantic_enabled = not embedding_breaker.is_open()
+        embedding_future = start_embedding() if CASCADE != 'bow_first' and semantic_enabled else None
+        kb_future = submit(load_settings_and_index, databases, db_id, coll_settings,
+                           coll_embeddings, embedding_provider.model_id)
+        bow_future = submit(prefetch_after_settings, databases, db_id, coll_settings, get_bow_index, coll_patterns)
+        responses_future = submit(prefetch_after_settings, databases, db_id, coll_settings,
+                                  get_response_map, coll_responses)
 
         intent_tag = None
         confidence = 0
         method_used = "none"
+        threshold = 0.5
+        cascade_stats['requests'] += 1
+
+        # 3. BoW first: a confident keyword match with a clear lead answers locally
+        if CASCADE == 'bow_first':
+            match = None
+            if semantic_enabled and not has_bow_index(db_id, coll_patterns):
+                # Cold load: waiting for the BoW index before embedding would serialize the
+                # two; embed speculatively and accept a wasted call if BoW answers after all
+                embedding_future = start_embedding()
+            try:
+                with stage('bow_index_wait'):
+                    bow_index = bow_future.result()
+                # Already cached by the prefetch that loaded the BoW index
+                threshold = float(get_settings(databases, db_id, coll_settings).get('threshold', threshold))
+                with stage('bow_first'):
+                    match = bow_first_match(user_msg, bow_index, threshold)
+            except Exception as e:
+                context.error(f"BoW-first check failed: {e}")
+            if match:
+                intent_tag, confidence = match
+                method_used = "bow_fast"
+                cascade_stats['semantic_skipped'] += 1
+            elif semantic_enabled and embedding_future is None:
+                embedding_future = start_embedding()
+
+        if not intent_tag and not semantic_enabled:
+            context.log(f"Embedding circuit {embedding_breaker.state}; skipping the semantic match")
+            try:
+                threshold = float(get_settings(databases, db_id, coll_settings).get('threshold', threshold))
+            except Exception as e:
+                context.error(f"Settings fetch error: {e}")
 
-        # 3. Try Semantic Embedding First
-        query_vector = get_query_embedding(user_msg, hf_client)
-        if query_vector:
-            embeddings_response = databases.list_documents(db_id, coll_embeddings, [Query.limit(5000)])
-            intent_tag, confidence = predict_intent_semantic(query_vector, embeddings_response['documents'], threshold=threshold)
-            method_used = "semantic"
-        
-        # 4. Fallback to Bag of Words if semantic fails or is below threshold
+        # 4. Semantic embedding match
+        if not intent_tag and semantic_enabled:
+            with stage('embedding_wait'):
+                query_vector = embedding_future.result()
+            try:
+                with stage('kb_wait'):
+                    settings, settings_error, embedding_index = kb_future.result()
+            except Exception as e:
+                # Without the index the semantic path is unusable; BoW still is
+                context.error(f"Embedding index fetch error: {e}")
+                settings, settings_error, embedding_index = {}, None, None
+                query_vector = None
+            if settings_error:
+                context.error(f"Settings fetch error: {settings_error}")
+            if 'threshold' in settings:
+                threshold = float(settings['threshold'])
+
+            if query_vector is not None:
+                with stage('semantic_scoring'):
+                    intent_tag, confidence, _ = predict_intent_semantic(query_vector, embedding_index,
+                                                                        threshold=threshold, sentence=user_msg)
+                method_used = "semantic"
+                if intent_tag and embedding_index.prefilter is not None:
+                    embedding_index.prefilter.record(intent_tag)
+
+        # 5. Fallback to Bag of Words if semantic fails or is below threshold
         if not intent_tag:
             context.log("Semantic matching failed or balance depleted. Falling back to Bag of Words...")
-            patterns_response = databases.list_documents(db_id, coll_patterns, [Query.limit(5000)])
-            intent_tag, confidence = predict_intent_bow(user_msg, patterns_response['documents'], threshold=threshold)
+            with stage('bow_index_wait'):
+                bow_index = bow_future.result()
+            with stage('bow_fallback'):
+                intent_tag, confidence = predict_intent_bow(user_msg, bow_index, threshold=threshold)
             method_used = "bow"
 
         context.log(f"Match Method: {method_used} | Intent: {intent_tag} | Confidence: {confidence}")
+        context.log(f"Query embedding cache: {query_cache.stats} (hit rate {query_cache.hit_rate():.0%})")
+        skip_rate = cascade_stats['semantic_skipped'] / cascade_stats['requests']
+        context.log(f"Cascade: {cascade_stats} (semantic skipped on {skip_rate:.0%})")
 
-        matched = False
-        if intent_tag:
-            responses_response = databases.list_documents(db_id, coll_responses, [Query.equal('intent_tag', intent_tag)])
-            responses = [r['text'] for r in responses_response['documents']]
-            
-            if responses:
-                final_response = random.choice(responses)
-                matched = True
-            else:
-                final_response = "I found the intent but have no response configured."
-        else:
-            final_response = "I'm sorry, I didn't quite understand that. Could you please rephrase your question about NWU?"
+        with stage('responses_wait'):
+            response_map = responses_future.result() if intent_tag else {}
+        final_response, matched = pick_response(response_map, intent_tag)
 
-        # 5. Log the Query
-        try:
-            databases.create_document(db_id, coll_logs, 'unique()', {
+        # 6. Log the Query (buffered and written in batches off the response path)
+        with stage('log_write'):
+            query_logger.log({
                 'query': user_msg,
                 'response': final_response,
                 'intent_tag': intent_tag or 'unknown',
-                'matched': matched
+                'matched': matched,
+                'timings': json.dumps(timer.as_dict(), separators=(',', ':'))
             })
-        except Exception as log_err:
-            context.error(f"Logging error: {log_err}")
+        timings = finish_timing(context, timer)
 
-        return context.res.json({
+        result = {
             "message": final_response,
             "intent": intent_tag,
             "confidence": confidence,
             "method": method_used
-        })
+        }
+        if payload.get('debug') or DEBUG_TIMINGS:
+            result["timings"] = timings
+            result["latency"] = latency_stats.percentiles()
+        return context.res.json(result)
 
     except Exception as e:
         context.error(str(e))
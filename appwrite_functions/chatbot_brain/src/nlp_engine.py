@@ -1,109 +1,664 @@
 import os
-import json
-import numpy as np
-import nltk
+import re
+import zlib
 import string
-from nltk.stem.lancaster import LancasterStemmer
-from nltk.corpus import stopwords
-from huggingface_hub import InferenceClient
+from collections import Counter
+from functools import lru_cache
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import numpy as np
+from .circuit_breaker import CircuitOpenError
+from .embedding_codec import decode_embeddings
+from .stopwords_en import NLTK_ENGLISH_STOP_WORDS
+
+# nltk and huggingface_hub cost ~0.4 s each to import; they are loaded on first use
+# so a semantic-only request never pays for the tokenizer and a local-embedding
+# deployment never imports the HF client.
 
 MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
-stemmer = LancasterStemmer()
 
-nltk.data.path.append("/tmp/nltk_data")
-for resource in ['punkt', 'punkt_tab', 'stopwords']:
-    try:
-        nltk.data.find(f'tokenizers/{resource}' if resource.startswith('punkt') else f'corpora/{resource}')
-    except LookupError:
-        if resource.startswith('punkt'):
-            nltk.download(resource, download_dir="/tmp/nltk_data")
-        else:
-            nltk.download(resource, download_dir="/tmp/nltk_data")
+# Punkt tables are vendored into the deployment by deploy_function.py; nothing is
+# downloaded at runtime
+NLTK_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'nltk_data')
 
-STOP_WORDS = set(stopwords.words('english'))
+STOP_WORDS = set(NLTK_ENGLISH_STOP_WORDS)
 STOP_WORDS.update(['want', 'know', 'like', 'tell', 'please', 'could', 'would', 'need'])
 
-def get_hf_client(token):
-    return InferenceClient(model=MODEL_ID, token=token)
+_nltk_state = {'stemmer': None, 'tokenize': None}
+
+def get_stemmer():
+    if _nltk_state['stemmer'] is None:
+        from nltk.stem.lancaster import LancasterStemmer
+        _nltk_state['stemmer'] = LancasterStemmer()
+    return _nltk_state['stemmer']
+
+def get_word_tokenizer():
+    if _nltk_state['tokenize'] is None:
+        import nltk
+        if NLTK_DATA_DIR not in nltk.data.path:
+            nltk.data.path.insert(0, NLTK_DATA_DIR)
+        try:
+            nltk.data.find('tokenizers/punkt_tab/english/')
+            tokenize = nltk.word_tokenize
+        except LookupError:
+            # Without Punkt, tokenize the whole message as one sentence; the only
+            # difference is how a full stop in the middle of a question is split off
+            print("Punkt data not bundled; tokenizing without sentence splitting")
+            def tokenize(sentence):
+                return nltk.word_tokenize(sentence, preserve_line=True)
+        _nltk_state['tokenize'] = tokenize
+    return _nltk_state['tokenize']
+
+# --- Embedding Providers ---
+
+# Wall-clock limit on one remote embedding call (and one batch call), in seconds; past it
+# the request is answered with Bag of Words instead of waiting out the HTTP timeout
+EMBEDDING_DEADLINE = float(os.environ.get('EMBEDDING_DEADLINE', '3'))
+EMBEDDING_BATCH_DEADLINE = float(os.environ.get('EMBEDDING_BATCH_DEADLINE', '10'))
+# HTTP statuses that mean "stop calling for a while": no credits, bad token, rate limited
+TRIP_STATUSES = {401, 402, 403, 429}
+
+class EmbeddingDeadlineExceeded(Exception):
+    pass
+
+class EmbeddingProvider:
+    """
+    Turns text into vectors. model_id is stored with every embedding document so the
+    brain only ever compares vectors produced by the same backend.
+    """
+    model_id = None
+    remote = False
+
+    def embed(self, text):
+        return self.embed_batch([text])[0]
+
+    def embed_batch(self, texts):
+        raise NotImplementedError
+
+class HFEmbeddingProvider(EmbeddingProvider):
+    """
+    Remote MiniLM embeddings through the HuggingFace inference API.
+    endpoint: URL of a dedicated feature-extraction server serving the same model (an
+    Inference Endpoint, or local_stack.py's fake); the default is the serverless API.
+    """
+
+    remote = True
+
+    def __init__(self, token, model_id=MODEL_ID, endpoint=None, timeout=None):
+        from huggingface_hub import InferenceClient
+        self.model_id = model_id
+        self.client = InferenceClient(model=endpoint or model_id, token=token, timeout=timeout)
+
+    def embed(self, text):
+        return np.asarray(self.client.feature_extraction(text), dtype=np.float32).ravel()
+
+    def embed_batch(self, texts):
+        vectors = np.asarray(self.client.feature_extraction(list(texts)), dtype=np.float32)
+        return vectors.reshape(len(texts), -1)
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """
+    Fully local CPU embedder: word unigrams and character n-grams hashed into a fixed
+    number of signed buckets with sublinear term frequency (stop words down-weighted),
+    then L2-normalized.
+    Deterministic and stateless, so the brain, proxy and backfill always agree.
+    """
+    TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+    FEATURE_WEIGHTS = {'w': 1.0, 'c': 0.5, 's': 0.2}
+
+    def __init__(self, dim=384, ngram_range=(3, 5)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.model_id = f"local-hashed-ngram-{dim}"
+
+    def features(self, text):
+        for word in self.TOKEN_RE.findall(text.lower()):
+            if word in STOP_WORDS:
+                yield 's:' + word
+                continue
+            yield 'w:' + word
+            padded = f"<{word}>"
+            for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+                for i in range(len(padded) - n + 1):
+                    yield 'c:' + padded[i:i + n]
+
+    def embed(self, text):
+        counts = {}
+        for feature in self.features(text):
+            counts[feature] = counts.get(feature, 0) + 1
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, tf in counts.items():
+            h = zlib.crc32(feature.encode('utf-8'))
+            sign = 1.0 if h & 0x80000000 else -1.0
+            # Whole words weigh more than any single character n-gram; stop words barely count
+            weight = self.FEATURE_WEIGHTS[feature[0]]
+            vector[h % self.dim] += sign * weight * (1.0 + np.log(tf))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
 
-def get_query_embedding(text, hf_client):
+    def embed_batch(self, texts):
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([self.embed(t) for t in texts])
+
+def get_embedding_provider(backend=None, token=None, timeout=None):
+    """
+    backend: 'hf' (default) or 'local'; falls back to the EMBEDDING_BACKEND env var.
+    timeout: HTTP timeout of remote calls in seconds; None waits as long as the client does
+    (e.g. out a model cold start during a backfill). The brain passes brain_timeout().
+    """
+    backend = (backend or os.environ.get('EMBEDDING_BACKEND', 'hf')).lower()
+    if backend == 'local':
+        return LocalEmbeddingProvider(dim=int(os.environ.get('LOCAL_EMBEDDING_DIM', '384')))
+    if backend == 'hf':
+        return HFEmbeddingProvider(token or os.environ.get('HF_API_TOKEN'),
+                                   endpoint=os.environ.get('HF_ENDPOINT_URL') or None, timeout=timeout)
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+# Runs guarded calls so the caller can stop waiting at the deadline; a call that overran
+# finishes (or hits the HTTP timeout) here while the request has moved on
+_deadline_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='embed-deadline')
+
+class GuardedEmbeddingProvider(EmbeddingProvider):
+    """
+    A remote provider behind a CircuitBreaker and a per-call deadline. Refused calls raise
+    CircuitOpenError, overruns EmbeddingDeadlineExceeded; both count as breaker failures.
+    """
+
+    def __init__(self, provider, breaker, deadline=None, batch_deadline=None):
+        self.provider = provider
+        self.breaker = breaker
+        self.model_id = provider.model_id
+        self.deadline = deadline or EMBEDDING_DEADLINE
+        self.batch_deadline = batch_deadline or EMBEDDING_BATCH_DEADLINE
+
+    def embed(self, text):
+        return self._call(self.provider.embed, text, self.deadline)
+
+    def embed_batch(self, texts):
+        return self._call(self.provider.embed_batch, texts, self.batch_deadline)
+
+    def _call(self, fn, arg, deadline):
+        return self.breaker.call(_wait_for, fn, arg, deadline, classify=_classify_failure)
+
+def _wait_for(fn, arg, deadline):
+    future = _deadline_pool.submit(fn, arg)
+    try:
+        return future.result(timeout=deadline)
+    except FutureTimeout:
+        future.cancel()
+        raise EmbeddingDeadlineExceeded(f"no answer within {deadline:g}s")
+
+def _classify_failure(error):
+    """(reason, trip, retry_after) of a failed embedding call, for CircuitBreaker.call()."""
+    if isinstance(error, EmbeddingDeadlineExceeded):
+        return str(error), False, None
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    retry_after = None
+    try:
+        retry_after = float(response.headers.get('Retry-After'))
+    except (AttributeError, TypeError, ValueError):
+        pass
+    return (f'HTTP {status}' if status else type(error).__name__), status in TRIP_STATUSES, retry_after
+
+def brain_timeout():
+    """HTTP timeout for a guarded provider: no call outlives the longer of its deadlines."""
+    return max(EMBEDDING_DEADLINE, EMBEDDING_BATCH_DEADLINE)
+
+def guard_provider(provider, breaker):
+    """Wraps remote providers; the local embedder has nothing to time out or trip."""
+    return GuardedEmbeddingProvider(provider, breaker) if provider.remote else provider
+
+def get_query_embedding(text, provider, cache=None):
+    """cache: optional QueryEmbeddingCache; a hit skips the provider call entirely"""
+    if cache is not None:
+        vector = cache.get(text, provider.model_id)
+        if vector is not None:
+            return vector
     try:
-        # returns a list or numpy array of floats
-        vector = hf_client.feature_extraction(text)
-        if hasattr(vector, 'tolist'):
-            return vector.tolist()
-        return vector
+        vector = provider.embed(text)
+    except CircuitOpenError:
+        return None
     except Exception as e:
         print(f"Embedding error: {e}")
         return None
+    if cache is not None:
+        cache.put(text, provider.model_id, vector)
+    return vector
 
-def cosine_similarity(v1, v2):
-    v1 = np.array(v1)
-    v2 = np.array(v2)
-    dot_product = np.dot(v1, v2)
-    norm_v1 = np.linalg.norm(v1)
-    norm_v2 = np.linalg.norm(v2)
-    if norm_v1 == 0 or norm_v2 == 0:
-        return 0
-    return dot_product / (norm_v1 * norm_v2)
-
-def predict_intent_semantic(query_vector, embeddings_data, threshold=0.5):
-    results = []
-    for doc in embeddings_data:
-        try:
-            pattern_vector = json.loads(doc['embedding'])
-            similarity = cosine_similarity(query_vector, pattern_vector)
-            results.append({'tag': doc['intent_tag'], 'score': similarity})
-        except Exception:
-            continue
-    results.sort(key=lambda x: x['score'], reverse=True)
-    if results and results[0]['score'] >= threshold:
-        return results[0]['tag'], results[0]['score']
-    return None, 0
+def get_query_embeddings(texts, provider, cache=None):
+    """
+    Vectors for many messages: cache hits first, then one embed_batch call for the
+    distinct misses. Returns a list aligned with texts; entries are None if embedding failed.
+    """
+    vectors = [cache.get(text, provider.model_id) if cache is not None else None for text in texts]
+    missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+    if not missing:
+        return vectors
+    try:
+        embedded = dict(zip(missing, provider.embed_batch(missing)))
+    except CircuitOpenError:
+        return vectors
+    except Exception as e:
+        print(f"Batch embedding error ({len(missing)} texts): {e}")
+        return vectors
+    if cache is not None:
+        for text, vector in embedded.items():
+            cache.put(text, provider.model_id, vector)
+    return [vector if vector is not None else embedded[text] for text, vector in zip(texts, vectors)]
+
+# Storage of the in-memory pattern matrix: 'float32', 'float16' (half the memory, but
+# 4-5x slower to score: NumPy widens it without SIMD) or 'int8' (a quarter, plus one
+# float32 scale per row, and faster than float32). Scores are always computed in float32.
+INDEX_PRECISION = os.environ.get('INDEX_PRECISION', 'float32')
+PRECISIONS = ('float32', 'float16', 'int8')
+STORAGE_DTYPES = (np.float32, np.float16, np.int8)
+# Rows of a float16/int8 matrix widened to float32 at a time while scoring
+SCORE_BLOCK = 256
+
+class EmbeddingIndex:
+    """
+    Contiguous, L2-normalized pattern matrix with a parallel intent-tag array
+    (and, optionally, the pattern text of every row).
+    Rows are grouped by intent so per-intent max pooling is a single reduceat.
+    The matrix is float32, float16, or int8 with a float32 scale per row (see quantize_index).
+    With a projection attached, the rows are PCA-projected and queries are projected on
+    the way into scores(); query_dim stays the model's dimension.
+    """
+
+    def __init__(self, matrix, tags, texts=None, scales=None):
+        if matrix.dtype not in STORAGE_DTYPES:
+            # e.g. float64 from NumPy arithmetic: scores() would widen it block by block
+            matrix = matrix.astype(np.float32)
+        tags = np.asarray(tags, dtype=object)
+        texts = np.asarray(texts, dtype=object) if texts is not None else None
+        order = np.argsort(tags, kind='stable')
+        if np.array_equal(order, np.arange(len(tags))):
+            # Already grouped (e.g. a memory-mapped snapshot): keep the matrix as-is, no copy
+            self.matrix = matrix
+            self.tags = tags
+            self.texts = texts
+            self.scales = scales
+        else:
+            self.matrix = np.ascontiguousarray(matrix[order])
+            self.tags = tags[order]
+            self.texts = texts[order] if texts is not None else None
+            self.scales = scales[order] if scales is not None else None
+        if len(tags):
+            boundaries = np.flatnonzero(self.tags[1:] != self.tags[:-1]) + 1
+            self.intent_starts = np.concatenate(([0], boundaries)).astype(np.intp)
+        else:
+            self.intent_starts = np.array([], dtype=np.intp)
+        self.intent_tags = self.tags[self.intent_starts]
+        # Intent number of every row, used to pool a subset of rows (ANN candidates)
+        self.row_intents = np.repeat(np.arange(len(self.intent_starts)),
+                                     np.diff(np.append(self.intent_starts, len(self.tags))))
+        # Optional approximate index over the rows, attached by ann_index.with_ann()
+        self.ann = None
+        # Optional per-intent centroids for two-stage retrieval, attached by centroids.with_centroids()
+        self.centroids = None
+        # Optional keyword candidate selection, attached by prefilter.with_prefilter()
+        self.prefilter = None
+        # Optional PCA projection of the rows, attached by projection.with_projection()
+        self.projection = None
+
+    def __len__(self):
+        return len(self.tags)
+
+    def intent_rows(self, intents):
+        """Row ids of the given intent positions, in row order."""
+        ends = np.append(self.intent_starts[1:], len(self.tags))
+        return np.concatenate([np.arange(self.intent_starts[i], ends[i]) for i in np.sort(intents)])
+
+    @property
+    def query_dim(self):
+        """Dimension of the query vectors this index scores (the model's, even when projected)."""
+        return self.projection.input_dim if self.projection is not None else self.matrix.shape[1]
+
+    @property
+    def precision(self):
+        return 'int8' if self.scales is not None else self.matrix.dtype.name
+
+    def dense(self, rows=slice(None)):
+        """The given rows (a slice or row ids) as float32 vectors, whatever the storage."""
+        block = np.asarray(self.matrix[rows], dtype=np.float32)
+        if self.scales is not None:
+            block *= self.scales[rows][:, None]
+        return block
+
+    def scores(self, query, rows=None):
+        """
+        Dot products of every row (or the given row ids) with a normalized query of shape
+        (dim,), or with each column of a (dim, n) query block. float16/int8 rows are widened
+        SCORE_BLOCK at a time, so no float32 copy of the matrix is ever made.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        if self.projection is not None:
+            query = self.projection.project_queries(query.T).T
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        if matrix.dtype == np.float32:
+            scores = matrix @ query
+        else:
+            scores = np.empty((len(matrix),) + query.shape[1:], dtype=np.float32)
+            widened = np.empty((min(SCORE_BLOCK, len(matrix)), matrix.shape[1]), dtype=np.float32)
+            for start in range(0, len(matrix), SCORE_BLOCK):
+                part = matrix[start:start + SCORE_BLOCK]
+                block = widened[:len(part)]
+                block[...] = part
+                np.dot(block, query, out=scores[start:start + len(part)])
+        if self.scales is not None:
+            scales = self.scales if rows is None else self.scales[rows]
+            scores *= scales if scores.ndim == 1 else scales[:, None]
+        return scores
+
+def quantize_index(index, precision=None):
+    """
+    Re-stores index.matrix in precision (default INDEX_PRECISION), in place. int8 keeps
+    round(row / scale) with scale = max|row| / 127, so every row uses the full int8 range.
+    Run it after ANN lists, centroids and any projection are attached; they are trained on float32 rows.
+    """
+    precision = precision or INDEX_PRECISION
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown index precision: {precision}")
+    if precision == index.precision or len(index) == 0:
+        return index
+    if precision == 'int8':
+        scales = np.empty(len(index), dtype=np.float32)
+        matrix = np.empty(index.matrix.shape, dtype=np.int8)
+        for start in range(0, len(index), BUILD_CHUNK):
+            block = index.dense(slice(start, start + BUILD_CHUNK))
+            block_scales = np.abs(block).max(axis=1) / 127
+            block_scales[block_scales == 0] = 1.0
+            matrix[start:start + len(block)] = np.rint(block / block_scales[:, None])
+            scales[start:start + len(block)] = block_scales
+        index.matrix, index.scales = matrix, scales
+    else:
+        index.matrix = index.dense().astype(precision)
+        index.scales = None
+    return index
+
+# Stored vectors decoded per step while building; the documents of one step are then dropped
+BUILD_CHUNK = 1000
+
+def build_embedding_index(embeddings_data):
+    """
+    embeddings_data: iterable of documents from Appwrite 'embeddings' collection, e.g. a list
+    or a kb_loader generator streaming the pages
+    Decodes the stored vectors a chunk at a time, so only the float32 rows are kept, and
+    normalizes the rows so scoring is a single dot product
+    """
+    documents = (doc for doc in embeddings_data if doc.get('embedding') and doc.get('intent_tag'))
+    blocks, tags, texts = [], [], []
+    while True:
+        chunk = list(islice(documents, BUILD_CHUNK))
+        if not chunk:
+            break
+        block, kept = decode_embeddings([doc['embedding'] for doc in chunk])
+        if kept:
+            blocks.append(block)
+            tags.append([chunk[i]['intent_tag'] for i in kept])
+            texts.append([chunk[i].get('pattern_text', '') for i in kept])
+    if not blocks:
+        return EmbeddingIndex(np.zeros((0, 0), dtype=np.float32), [])
+
+    # A collection should hold one model; if chunks disagree, keep the most common dimension
+    rows_per_dim = Counter()
+    for block in blocks:
+        rows_per_dim[block.shape[1]] += len(block)
+    dim = rows_per_dim.most_common(1)[0][0]
+    keep = [i for i, block in enumerate(blocks) if block.shape[1] == dim]
+    matrix = blocks[keep[0]] if len(keep) == 1 else np.concatenate([blocks[i] for i in keep])
+    tags = [tag for i in keep for tag in tags[i]]
+    texts = [text for i in keep for text in texts[i]]
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return EmbeddingIndex(matrix, tags, texts)
+
+def normalize_query(query_vector, dim):
+    query = np.asarray(query_vector, dtype=np.float32).ravel()
+    if query.shape[0] != dim:
+        return None
+    norm = np.linalg.norm(query)
+    if norm == 0:
+        return None
+    return query / norm
+
+def _top_positions(intent_scores, top_k):
+    """Positions of the top_k scores, best first; ties keep their order."""
+    k = min(top_k, len(intent_scores))
+    if k < len(intent_scores):
+        top = np.argpartition(intent_scores, -k)[-k:]
+    else:
+        top = np.arange(len(intent_scores))
+    return top[np.argsort(-intent_scores[top], kind='stable')]
+
+def candidate_rows(query, index, sentence=None):
+    """
+    Sorted row ids to score instead of the whole matrix, from the first narrower candidate
+    set attached to the index: rows sharing a keyword with sentence, patterns of the
+    closest intent centroids, ANN lists. None means the full scan.
+    """
+    if index.prefilter is not None and sentence:
+        rows = index.prefilter.candidates(sentence, index)
+        if len(rows):
+            return rows
+    if index.centroids is not None:
+        return index.intent_rows(index.centroids.search(query))
+    if index.ann is not None:
+        return np.sort(index.ann.search(query))
+    return None
+
+def rank_intents(query, index, top_k=5, sentence=None):
+    """
+    Scores a normalized query against every pattern with one matrix-vector product,
+    max-pools the scores per intent and returns the top_k (tag, score) pairs, best first.
+    """
+    if len(index) == 0:
+        return []
+    rows = candidate_rows(query, index, sentence)
+    if rows is not None and len(rows):
+        scores = index.scores(query, rows)
+        # Rows are grouped by intent, so sorted candidate rows are too
+        intents = index.row_intents[rows]
+        starts = np.concatenate(([0], np.flatnonzero(intents[1:] != intents[:-1]) + 1))
+        intent_scores = np.maximum.reduceat(scores, starts)
+        intent_ids = intents[starts]
+    else:
+        scores = index.scores(query)
+        intent_scores = np.maximum.reduceat(scores, index.intent_starts)
+        intent_ids = np.arange(len(intent_scores))
+    return [(index.intent_tags[intent_ids[i]], float(intent_scores[i]))
+            for i in _top_positions(intent_scores, top_k)]
+
+def predict_intent_semantic(query_vector, embeddings_data, threshold=0.5, top_k=5, sentence=None):
+    """
+    embeddings_data: an EmbeddingIndex, or a list of documents from the 'embeddings' collection
+    sentence: the raw message, used by a keyword prefilter if the index has one
+    Returns (tag, score, candidates) where candidates are the top_k intents by best pattern score
+    """
+    index = embeddings_data
+    if not isinstance(index, EmbeddingIndex):
+        index = build_embedding_index(embeddings_data)
+    if len(index) == 0:
+        return None, 0, []
+
+    query = normalize_query(query_vector, index.query_dim)
+    if query is None:
+        return None, 0, []
+
+    candidates = rank_intents(query, index, top_k=top_k, sentence=sentence)
+    if candidates and candidates[0][1] >= threshold:
+        return candidates[0][0], candidates[0][1], candidates
+    return None, 0, candidates
+
+# Queries scored per matrix-matrix product; bounds the (queries x patterns) score block
+BATCH_BLOCK = 64
+
+def rank_intents_batch(queries, index, top_k=5):
+    """
+    queries: (n, dim) matrix of normalized query rows. Scores every query against every
+    pattern with one matrix-matrix product per BATCH_BLOCK queries, max-pools per intent
+    and returns a top_k (tag, score) list per query, like rank_intents.
+    """
+    ranked = []
+    if len(index) == 0:
+        return [[] for _ in range(len(queries))]
+    for start in range(0, len(queries), BATCH_BLOCK):
+        scores = index.scores(queries[start:start + BATCH_BLOCK].T).T
+        intent_scores = np.maximum.reduceat(scores, index.intent_starts, axis=1)
+        for row in intent_scores:
+            ranked.append([(index.intent_tags[i], float(row[i])) for i in _top_positions(row, top_k)])
+    return ranked
+
+def predict_intents_semantic(query_vectors, embeddings_data, threshold=0.5, top_k=5):
+    """
+    Batch form of predict_intent_semantic: one (tag, score, candidates) per query vector.
+    Every query is scored exactly, whatever candidate stages the index has attached.
+    """
+    index = embeddings_data
+    if not isinstance(index, EmbeddingIndex):
+        index = build_embedding_index(embeddings_data)
+    results = [(None, 0, [])] * len(query_vectors)
+    if len(index) == 0:
+        return results
+
+    dim = index.query_dim
+    queries = [normalize_query(v, dim) if v is not None else None for v in query_vectors]
+    valid = [i for i, query in enumerate(queries) if query is not None]
+    if not valid:
+        return results
+    ranked = rank_intents_batch(np.stack([queries[i] for i in valid]), index, top_k=top_k)
+    for i, candidates in zip(valid, ranked):
+        if candidates and candidates[0][1] >= threshold:
+            results[i] = (candidates[0][0], candidates[0][1], candidates)
+        else:
+            results[i] = (None, 0, candidates)
+    return results
 
 # --- Fallback Bag of Words Logic ---
 
-def clean_up_sentence(sentence):
-    sentence_words = nltk.word_tokenize(sentence)
-    sentence_words = [stemmer.stem(word.lower()) for word in sentence_words 
+# 'nltk' runs Punkt + the Treebank word tokenizer; 'fast' is a compiled-regex splitter
+# that yields the same BoW matches on our intents (see bench_tokenizer.py)
+TOKENIZER = os.environ.get('TOKENIZER', 'nltk')
+
+# Mirrors the Treebank rules that matter for FAQ text: clitics split off ("don't" ->
+# "do" "n't", "it's" -> "it" "'s"), punctuation split off, and numbers, times, dates
+# and hyphenated words ("N150,000", "10:30", "2024/2025", "e-mail") kept whole
+# and double quotes rewritten to `` / '' like the Treebank tokenizer
+_CLITIC_RE = re.compile(r"(?i)(?<=\w)(n't|'(?:s|m|d|ll|re|ve))\b")
+_OPEN_QUOTE_RE = re.compile(r'(?:^|(?<=[\s(\[{<]))"')
+_FAST_TOKEN_RE = re.compile(r"(?i)``|''|n't|'(?:s|m|d|ll|re|ve)\b|\w+(?:[-'./:,]\w+)*|\.\.\.|[^\w\s]")
+# Tokens dropped before stemming: stop words plus anything the NLTK path treats as punctuation
+_SKIP_TOKENS = frozenset(STOP_WORDS) | frozenset(string.punctuation) | frozenset([''])
+
+def fast_tokenize(sentence):
+    sentence = _OPEN_QUOTE_RE.sub(' `` ', sentence).replace('"', " '' ")
+    return _FAST_TOKEN_RE.findall(_CLITIC_RE.sub(r' \1', sentence))
+
+@lru_cache(maxsize=8192)
+def stem_word(word):
+    return get_stemmer().stem(word)
+
+def clean_up_sentence(sentence, tokenizer=None):
+    if (tokenizer or TOKENIZER) == 'fast':
+        return [stem_word(word) for word in map(str.lower, fast_tokenize(sentence))
+                if word not in _SKIP_TOKENS]
+
+    sentence_words = get_word_tokenizer()(sentence)
+    sentence_words = [stem_word(word.lower()) for word in sentence_words
                       if word not in string.punctuation and word.lower() not in STOP_WORDS]
     return sentence_words
 
-def bag_of_words(sentence, words):
-    sentence_words = clean_up_sentence(sentence)
-    bag = [0] * len(words)  
-    for s in sentence_words:
-        for i, w in enumerate(words):
-            if w == s: 
-                bag[i] = 1
-    return np.array(bag)
+class BowIndex:
+    """
+    Sparse inverted index over the patterns: stem -> ids of the patterns containing it,
+    plus each pattern's binary BoW norm. Built once, then a query only touches the
+    postings of its own stems.
+    """
+
+    def __init__(self, patterns_data):
+        postings = {}
+        tags = []
+        norms = []
+        for p in patterns_data:
+            stems = set(clean_up_sentence(p['text']))
+            pattern_id = len(tags)
+            for stem in stems:
+                postings.setdefault(stem, []).append(pattern_id)
+            tags.append(p['intent_tag'])
+            norms.append(np.sqrt(len(stems)))
+        self.postings = {stem: np.array(ids, dtype=np.intp) for stem, ids in postings.items()}
+        self.tags = np.array(tags, dtype=object)
+        self.norms = np.array(norms, dtype=np.float64)
+
+    @classmethod
+    def from_parts(cls, postings, tags, norms):
+        """Rebuilds a precompiled index (e.g. from a deployment snapshot) without re-stemming."""
+        index = cls.__new__(cls)
+        index.postings = {stem: np.asarray(ids, dtype=np.intp) for stem, ids in postings.items()}
+        index.tags = np.array(tags, dtype=object)
+        index.norms = np.asarray(norms, dtype=np.float64)
+        return index
+
+    def to_parts(self):
+        return {
+            'postings': {stem: ids.tolist() for stem, ids in self.postings.items()},
+            'tags': self.tags.tolist(),
+            'norms': self.norms.tolist()
+        }
+
+    def __len__(self):
+        return len(self.tags)
+
+    def score(self, sentence):
+        """Returns (pattern_ids, similarities) for every pattern sharing a stem with the sentence."""
+        stems = [s for s in set(clean_up_sentence(sentence)) if s in self.postings]
+        if not stems:
+            return np.array([], dtype=np.intp), np.array([], dtype=np.float64)
+        ids, overlap = np.unique(np.concatenate([self.postings[s] for s in stems]), return_counts=True)
+        return ids, overlap / (np.sqrt(len(stems)) * self.norms[ids])
+
+    def rank_intents(self, sentence, top_k=5):
+        ids, scores = self.score(sentence)
+        # Highest score first; ties keep pattern order, like the original stable sort
+        order = np.argsort(-scores, kind='stable')
+        ranked = []
+        seen = set()
+        for i in order:
+            tag = self.tags[ids[i]]
+            if tag in seen:
+                continue
+            seen.add(tag)
+            ranked.append((tag, float(scores[i])))
+            if len(ranked) == top_k:
+                break
+        return ranked
 
 def predict_intent_bow(sentence, patterns_data, threshold=0.5):
     """
-    patterns_data: list of documents from Appwrite 'patterns' collection
+    patterns_data: a BowIndex, or a list of documents from Appwrite 'patterns' collection
     Uses cosine similarity for BoW vectors
     """
-    vocabulary = []
-    for p in patterns_data:
-        vocabulary.extend(clean_up_sentence(p['text']))
-    vocabulary = sorted(list(set(vocabulary)))
-
-    input_vec = bag_of_words(sentence, vocabulary)
-    input_norm = np.linalg.norm(input_vec)
-    
-    results = []
-    for p in patterns_data:
-        p_vec = bag_of_words(p['text'], vocabulary)
-        p_norm = np.linalg.norm(p_vec)
-        
-        dot_product = np.dot(input_vec, p_vec)
-        if input_norm > 0 and p_norm > 0:
-            similarity = dot_product / (input_norm * p_norm)
-        else:
-            similarity = 0
-        results.append((p['intent_tag'], similarity))
+    index = patterns_data
+    if not isinstance(index, BowIndex):
+        index = BowIndex(patterns_data)
 
-    results.sort(key=lambda x: x[1], reverse=True)
-    if results and results[0][1] >= threshold:
-        return results[0][0], results[0][1]
+    ranked = index.rank_intents(sentence, top_k=1)
+    if ranked and ranked[0][1] >= threshold:
+        return ranked[0]
     return None, 0
+
+def bow_margin(sentence, bow_index):
+    """
+    Returns (tag, score, margin) for the best BoW intent, where margin is its lead over the
+    runner-up intent (the full score when there is none). (None, 0, 0) when nothing overlaps.
+    """
+    ranked = bow_index.rank_intents(sentence, top_k=2)
+    if not ranked:
+        return None, 0, 0
+    tag, score = ranked[0]
+    return tag, score, score - (ranked[1][1] if len(ranked) > 1 else 0)
@@ -0,0 +1,63 @@
+import os
+import numpy as np
+from .nlp_engine import BowIndex, clean_up_sentence
+
+# Hybrid retrieval: the stems of the message pick the embedding rows whose pattern
+# shares at least one of them, plus every row of the PREFILTER_PRIOR_INTENTS most
+# frequently answered intents, and only those rows are scored semantically. A message
+# with no known stem gets the full scan.
+KEYWORD_PREFILTER = os.environ.get('KEYWORD_PREFILTER', 'off')
+PREFILTER_PRIOR_INTENTS = int(os.environ.get('PREFILTER_PRIOR_INTENTS', '3'))
+
+class KeywordPrefilter:
+    """
+    rows:    BowIndex over the pattern texts of the embedding rows (pattern id == row id)
+    weights: prior per intent position; answered queries add 1, the intent's share of
+             patterns (< 1) only breaks ties before there is any traffic
+    """
+
+    def __init__(self, rows, intent_tags, intent_sizes, prior_intents=PREFILTER_PRIOR_INTENTS):
+        self.rows = rows
+        self.intent_ids = {tag: i for i, tag in enumerate(intent_tags)}
+        sizes = np.asarray(intent_sizes, dtype=np.float64)
+        self.weights = sizes / (sizes.max() + 1) if len(sizes) else sizes
+        self.prior_intents = prior_intents
+
+    def record(self, tag):
+        """Counts an answered query towards its intent's prior."""
+        i = self.intent_ids.get(tag)
+        if i is not None:
+            self.weights[i] += 1
+
+    def candidates(self, sentence, index):
+        """Sorted candidate row ids for sentence; empty when no stem of it is indexed."""
+        stems = [s for s in set(clean_up_sentence(sentence)) if s in self.rows.postings]
+        if not stems:
+            return np.array([], dtype=np.intp)
+        parts = [self.rows.postings[s] for s in stems]
+        n_prior = min(self.prior_intents, len(self.weights))
+        if n_prior > 0:
+            parts.append(index.intent_rows(np.argpartition(self.weights, -n_prior)[-n_prior:]))
+        return np.unique(np.concatenate(parts))
+
+def build_row_index(texts, tags):
+    """BowIndex over the pattern text of every embedding row, in row order."""
+    return BowIndex([{'text': text, 'intent_tag': tag} for text, tag in zip(texts, tags)])
+
+def with_prefilter(index, texts=None, parts=None):
+    """
+    Attaches a KeywordPrefilter to an EmbeddingIndex when KEYWORD_PREFILTER=keyword.
+    parts is a prebuilt row index (BowIndex.to_parts(), e.g. from the snapshot); otherwise
+    texts, the pattern text of every row in index order, are stemmed here.
+    """
+    if KEYWORD_PREFILTER != 'keyword' or len(index) == 0:
+        return index
+    if parts is not None and len(parts['norms']) == len(index):
+        rows = BowIndex.from_parts(**parts)
+    elif texts is not None and len(texts) == len(index):
+        rows = build_row_index(texts, index.tags)
+    else:
+        print("KEYWORD_PREFILTER=keyword but no pattern texts for the embedding rows; prefilter off")
+        return index
+    index.prefilter = KeywordPrefilter(rows, index.intent_tags, np.diff(np.append(index.intent_starts, len(index))))
+    return index
@@ -0,0 +1,107 @@
+import os
+import hashlib
+import numpy as np
+
+# Optional PCA projection of the pattern matrix to PCA_DIM dimensions (e.g. 64 or 128),
+# fitted when the index is built. Rows are projected once, queries on every request;
+# scoring then touches PCA_DIM + 1 columns instead of the model's 384.
+# 0 keeps the full vectors. Run check_projection.py before changing it.
+PCA_DIM = int(os.environ.get('PCA_DIM', '0'))
+# Rows sampled to fit the projection; the axes of a large KB settle long before this
+PCA_FIT_ROWS = int(os.environ.get('PCA_FIT_ROWS', '20000'))
+PROJECT_BLOCK = 8192
+
+class PCAProjection:
+    """
+    mean:       (dim,) mean pattern vector
+    components: (k, dim) orthonormal principal axes, largest variance first
+    A row x is stored as [components @ (x - mean), 1] and a query q as
+    [components @ q, mean @ q], so their dot product is the original cosine minus only
+    the part of (x - mean) outside the k axes, and scores stay on the cosine scale.
+    version fingerprints the matrices, so an index and its projection can be matched.
+    """
+
+    def __init__(self, mean, components, explained=None):
+        self.mean = np.ascontiguousarray(mean, dtype=np.float32)
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+        self.explained = explained
+        digest = hashlib.sha1(self.mean.tobytes() + self.components.tobytes()).hexdigest()
+        self.version = f"pca{len(self.components)}-{digest[:12]}"
+
+    @property
+    def input_dim(self):
+        return self.components.shape[1]
+
+    @property
+    def output_dim(self):
+        return len(self.components) + 1
+
+    def project_rows(self, rows):
+        """(n, input_dim) rows -> (n, output_dim) float32, a block at a time."""
+        projected = np.empty((len(rows), self.output_dim), dtype=np.float32)
+        projected[:, -1] = 1.0
+        for start in range(0, len(rows), PROJECT_BLOCK):
+            block = np.asarray(rows[start:start + PROJECT_BLOCK], dtype=np.float32) - self.mean
+            projected[start:start + len(block), :-1] = block @ self.components.T
+        return projected
+
+    def project_queries(self, queries):
+        """A (input_dim,) query or (n, input_dim) queries -> output_dim columns."""
+        queries = np.asarray(queries, dtype=np.float32)
+        return np.concatenate([queries @ self.components.T, (queries @ self.mean)[..., None]], axis=-1)
+
+    def describe(self):
+        return {'kind': 'pca', 'version': self.version, 'input_dim': self.input_dim,
+                'output_dim': self.output_dim, 'explained': self.explained}
+
+    def save(self, path):
+        np.savez(path, mean=self.mean, components=self.components, explained=np.float64(self.explained or 0))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as parts:
+            return cls(parts['mean'], parts['components'], float(parts['explained']) or None)
+
+def fit_pca(matrix, n_components, max_rows=None, seed=0):
+    """PCA of (a sample of) the rows through a thin SVD of the centred matrix."""
+    max_rows = max_rows or PCA_FIT_ROWS
+    if len(matrix) > max_rows:
+        sample_ids = np.sort(np.random.default_rng(seed).choice(len(matrix), size=max_rows, replace=False))
+        sample = np.asarray(matrix[sample_ids], dtype=np.float32)
+    else:
+        sample = np.asarray(matrix, dtype=np.float32)
+    mean = sample.mean(axis=0)
+    _, singular, axes = np.linalg.svd(sample - mean, full_matrices=False)
+    n_components = min(n_components, len(axes))
+    components = axes[:n_components]
+    # SVD signs are arbitrary; fix them so refits of the same data give the same version
+    signs = np.sign(components[np.arange(n_components), np.argmax(np.abs(components), axis=1)])
+    components = components * signs[:, None]
+    variance = singular ** 2
+    explained = float(variance[:n_components].sum() / variance.sum()) if variance.sum() > 0 else 1.0
+    return PCAProjection(mean, components, explained)
+
+def with_projection(index, projection=None, n_components=None):
+    """
+    Replaces the rows of an EmbeddingIndex with their projection to n_components (default
+    PCA_DIM) dimensions, in place. A given projection (e.g. from the snapshot) is used if
+    it fits the rows, otherwise one is fitted. Runs after ANN lists and centroids (which
+    stay in the model's space) are attached and before quantize_index.
+    """
+    n_components = PCA_DIM if n_components is None else n_components
+    if n_components <= 0 or index.projection is not None or len(index) == 0:
+        return index
+    dim = index.matrix.shape[1]
+    if n_components + 1 >= dim:
+        return index
+    # A KB with fewer rows than n_components gets one axis per row (and an exact projection)
+    expected = min(n_components, len(index))
+    if projection is None or projection.input_dim != dim or projection.output_dim != expected + 1:
+        projection = fit_pca(index.dense() if index.scales is not None else index.matrix, n_components)
+        print(f"Fitted PCA projection {projection.version}: {dim} -> {projection.output_dim - 1} dims "
+              f"({projection.explained:.1%} of the variance)")
+    rows = index.matrix if index.matrix.dtype == np.float32 else index.dense()
+    index.matrix = projection.project_rows(rows)
+    index.scales = None
+    index.projection = projection
+    return index
@@ -0,0 +1,140 @@
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+WHITESPACE_RE = re.compile(r'\s+')
+EDGE_PUNCTUATION = ' \t\n?!.,;:'
+
+def normalize_text(text):
+    """Students retype the same question with different casing, spacing and trailing '?'."""
+    return WHITESPACE_RE.sub(' ', text.lower()).strip(EDGE_PUNCTUATION)
+
+class QueryEmbeddingCache:
+    """
+    Two-tier cache for query vectors keyed by sha256(model id + normalized text):
+    a bounded in-process LRU, backed by an optional directory of .npy files that
+    outlives a single container (e.g. /tmp on a warm function host). The directory keeps
+    at most max_files vectors; past that the least recently used files are pruned.
+    Shared by concurrent requests and io_pool threads, so the LRU is only touched under a lock.
+    """
+
+    def __init__(self, max_size=1024, persist_dir=None, max_files=10000):
+        self.max_size = max_size
+        self.persist_dir = persist_dir
+        self.max_files = max_files
+        # Pruning lists the whole directory, so it runs once per tenth of max_files writes
+        self.prune_every = max(1, max_files // 10)
+        self._writes = 0
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'pruned': 0}
+        if persist_dir:
+            try:
+                os.makedirs(persist_dir, exist_ok=True)
+            except OSError as e:
+                print(f"Query cache dir unavailable, using memory only: {e}")
+                self.persist_dir = None
+        if self.persist_dir:
+            # A warm host may hand over a directory filled by an earlier, uncapped container
+            self.prune()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_size=int(os.environ.get('QUERY_CACHE_SIZE', '1024')),
+            persist_dir=os.environ.get('QUERY_CACHE_DIR', '/tmp/nwu_query_cache') or None,
+            max_files=int(os.environ.get('QUERY_CACHE_MAX_FILES', '10000'))
+        )
+
+    def key(self, text, model_id):
+        return hashlib.sha256(f"{model_id}\n{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.persist_dir, f"{key}.npy")
+
+    def get(self, text, model_id):
+        key = self.key(text, model_id)
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return vector
+
+        if self.persist_dir:
+            try:
+                vector = np.load(self._path(key))
+                # mtime is the file's last use, so pruning drops the least recently used
+                os.utime(self._path(key))
+                self._remember(key, vector, disk_hit=True)
+                return vector
+            except (OSError, ValueError):
+                pass
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, text, model_id, vector):
+        key = self.key(text, model_id)
+        vector = np.asarray(vector, dtype=np.float32)
+        self._remember(key, vector)
+        if self.persist_dir:
+            # Write then rename so a concurrent reader never sees a half-written file
+            tmp_path = self._path(key) + f".{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, vector)
+                os.replace(tmp_path, self._path(key))
+            except OSError as e:
+                print(f"Query cache write error: {e}")
+                return
+            with self._lock:
+                self._writes += 1
+                due = self._writes % self.prune_every == 0
+            if due:
+                self.prune()
+
+    def prune(self):
+        """Deletes the least recently used .npy files beyond max_files; returns how many."""
+        try:
+            entries = [(entry.stat().st_mtime, entry.path) for entry in os.scandir(self.persist_dir)
+                       if entry.name.endswith('.npy')]
+        except OSError as e:
+            print(f"Query cache prune error: {e}")
+            return 0
+        if len(entries) <= self.max_files:
+            return 0
+        entries.sort()
+        removed = 0
+        for _, path in entries[:len(entries) - self.max_files]:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                # Already pruned by another worker sharing the directory
+                pass
+        with self._lock:
+            self.stats['pruned'] += removed
+        return removed
+
+    def _remember(self, key, vector, disk_hit=False):
+        with self._lock:
+            self._lru[key] = vector
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_size:
+                self._lru.popitem(last=False)
+            if disk_hit:
+                self.stats['disk_hits'] += 1
+
+    def hit_rate(self):
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        total = hits + self.stats['misses']
+        return hits / total if total else 0.0
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import atexit
+import threading
+from collections import deque
+
+# Statuses of a server without the bulk create_documents endpoint (Appwrite < 1.7)
+BULK_UNSUPPORTED = {404, 405, 501}
+
+class QueryLogger:
+    """
+    Takes the logs collection write off the response path.
+
+    mode 'async': records go into a bounded in-memory buffer that a daemon thread
+                  flushes in batches; on overflow records are either spooled or dropped.
+    mode 'spool': records are only appended to a local JSONL spool, shipped later by
+                  the scheduled execution (for hosts that freeze the container as soon
+                  as the response is sent).
+    mode 'sync':  the previous behaviour, one write per request.
+    Anything that fails to reach Appwrite lands in the spool instead of being lost, up to
+    max_spool_bytes; past that the oldest spooled records are dropped.
+    optional_fields are attributes the collection may not have yet (added by a later
+    setup_appwrite.py): when Appwrite rejects one as unknown, it is left out of every
+    write from then on instead of failing (and spooling) all the logs.
+    """
+
+    def __init__(self, mode='async', max_buffer=500, batch_size=50, flush_interval=1.0,
+                 overflow='spool', spool_path='/tmp/nwu_query_logs.jsonl', max_spool_bytes=5_000_000,
+                 optional_fields=()):
+        self.mode = mode
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.spool_path = spool_path
+        self.max_spool_bytes = max_spool_bytes
+        self.bulk = True
+        self.optional_fields = set(optional_fields)
+        self.missing_fields = set()
+        self.target = None
+        self.stats = {'enqueued': 0, 'written': 0, 'spooled': 0, 'dropped': 0, 'failed_batches': 0}
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+        atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls, optional_fields=()):
+        return cls(
+            optional_fields=optional_fields,
+            mode=os.environ.get('LOG_MODE', 'async'),
+            max_buffer=int(os.environ.get('LOG_BUFFER_SIZE', '500')),
+            batch_size=int(os.environ.get('LOG_BATCH_SIZE', '50')),
+            flush_interval=float(os.environ.get('LOG_FLUSH_INTERVAL', '1.0')),
+            overflow=os.environ.get('LOG_OVERFLOW', 'spool'),
+            spool_path=os.environ.get('LOG_SPOOL_PATH', '/tmp/nwu_query_logs.jsonl'),
+            max_spool_bytes=int(os.environ.get('LOG_SPOOL_MAX_BYTES', '5000000'))
+        )
+
+    def bind(self, databases, db_id, collection):
+        self.target = (databases, db_id, collection)
+
+    def log(self, record):
+        if self.mode == 'sync':
+            if not self._write([record]):
+                self._spool([record])
+            return
+        if self.mode == 'spool':
+            self._spool([record])
+            return
+
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                if self.overflow == 'drop':
+                    self.stats['dropped'] += 1
+                    return
+                overflowed = True
+            else:
+                self._buffer.append(record)
+                self.stats['enqueued'] += 1
+                overflowed = False
+                pending = len(self._buffer)
+
+        if overflowed:
+            self._spool([record])
+            return
+        if not self._ensure_worker():
+            self._spool(self._drain())
+        elif pending >= self.batch_size:
+            self._wakeup.set()
+
+    def log_many(self, records):
+        """Bulk form of log(): sync mode writes batch_size records per create_documents call."""
+        if self.mode == 'sync':
+            for i in range(0, len(records), self.batch_size):
+                batch = records[i:i + self.batch_size]
+                if not self._write(batch):
+                    self._spool(batch)
+            return
+        if self.mode == 'spool':
+            self._spool(records)
+            return
+        for record in records:
+            self.log(record)
+        # Don't wait out the flush interval with a full batch (or more) already queued
+        if self._worker is not None:
+            self._wakeup.set()
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return True
+        try:
+            self._worker = threading.Thread(target=self._run, name='query-log-flusher', daemon=True)
+            self._worker.start()
+            return True
+        except RuntimeError as e:
+            print(f"Log flusher unavailable, spooling: {e}")
+            self._worker = None
+            return False
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _drain(self, limit=None):
+        with self._lock:
+            count = len(self._buffer) if limit is None else min(limit, len(self._buffer))
+            return [self._buffer.popleft() for _ in range(count)]
+
+    def flush(self):
+        """Writes everything buffered in batches; failed batches go to the spool."""
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                return
+            if not self._write(batch):
+                self._spool(batch)
+
+    def _write(self, records):
+        if self.target is None or not records:
+            return False
+        databases, db_id, collection = self.target
+        if self.missing_fields:
+            records = [{k: v for k, v in r.items() if k not in self.missing_fields} for r in records]
+        try:
+            if self.bulk:
+                try:
+                    databases.create_documents(db_id, collection, [dict(r, **{'$id': 'unique()'}) for r in records])
+                except AttributeError:
+                    # Older SDKs have no bulk endpoint
+                    self.bulk = False
+                except Exception as e:
+                    if getattr(e, 'code', None) not in BULK_UNSUPPORTED:
+                        raise
+                    print(f"Bulk log writes unsupported by the server ({e}), writing one by one")
+                    self.bulk = False
+            if not self.bulk:
+                for record in records:
+                    databases.create_document(db_id, collection, 'unique()', record)
+            self.stats['written'] += len(records)
+            return True
+        except Exception as e:
+            missing = self._unknown_optional_field(e, records)
+            if missing:
+                print(f"logs collection has no '{missing}' attribute, writing logs without it "
+                      f"(re-run setup_appwrite.py to add it)")
+                self.missing_fields.add(missing)
+                return self._write(records)
+            print(f"Logging error ({len(records)} records): {e}")
+            self.stats['failed_batches'] += 1
+            return False
+
+    def _unknown_optional_field(self, error, records):
+        if getattr(error, 'code', None) != 400 or 'unknown attribute' not in str(error).lower():
+            return None
+        for field in self.optional_fields - self.missing_fields:
+            if f'"{field}"' in str(error) and any(field in r for r in records):
+                return field
+        return None
+
+    def _spool(self, records):
+        if not records:
+            return
+        try:
+            with self._spool_lock:
+                with open(self.spool_path, 'a', encoding='utf-8') as f:
+                    for record in records:
+                        f.write(json.dumps(record, separators=(',', ':')) + '\n')
+                self.stats['spooled'] += len(records)
+                if os.path.getsize(self.spool_path) > self.max_spool_bytes:
+                    self._trim_spool()
+        except OSError as e:
+            print(f"Log spool error, dropping {len(records)} records: {e}")
+            self.stats['dropped'] += len(records)
+
+    def _trim_spool(self):
+        """Keeps the newest records within 3/4 of max_spool_bytes, so trims stay rare."""
+        with open(self.spool_path, encoding='utf-8') as f:
+            lines = f.readlines()
+        kept, size = [], 0
+        for line in reversed(lines):
+            size += len(line.encode('utf-8'))
+            if size > self.max_spool_bytes * 3 // 4:
+                break
+            kept.append(line)
+        tmp_path = f"{self.spool_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(reversed(kept))
+        os.replace(tmp_path, self.spool_path)
+        dropped = len(lines) - len(kept)
+        self.stats['dropped'] += dropped
+        print(f"Log spool over {self.max_spool_bytes} bytes, dropped the oldest {dropped} records")
+
+    def ship_spool(self):
+        """Sends spooled records to Appwrite; called from the scheduled execution."""
+        shipping_path = f"{self.spool_path}.{os.getpid()}.{time.monotonic_ns()}.shipping"
+        with self._spool_lock:
+            try:
+                os.replace(self.spool_path, shipping_path)
+            except FileNotFoundError:
+                return 0
+        with open(shipping_path, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        os.remove(shipping_path)
+
+        shipped = 0
+        for i in range(0, len(records), self.batch_size):
+            batch = records[i:i + self.batch_size]
+            if self._write(batch):
+                shipped += len(batch)
+            else:
+                self._spool(records[i:])
+                break
+        return shipped
+
+    def close(self):
+        # Interpreter shutdown: a local append is the only write that reliably finishes
+        self._spool(self._drain())
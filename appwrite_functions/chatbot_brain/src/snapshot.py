@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import numpy as np
+from .nlp_engine import EmbeddingIndex, BowIndex, build_embedding_index, quantize_index
+from .ann_index import IVFIndex, with_ann
+from .centroids import compute_centroids, with_centroids
+from .prefilter import build_row_index, with_prefilter
+from .projection import PCA_DIM, PCAProjection, fit_pca, with_projection
+
+# Written by build_snapshot.py at deploy time and shipped inside the function bundle:
+#   snapshot/embeddings.npy  intent-grouped, normalized float32 matrix (memory-mapped)
+#   snapshot/kb.json         version marker, row tags, prebuilt BoW index, responses
+#                            keyword index over the rows (for KEYWORD_PREFILTER=keyword at runtime)
+#   snapshot/ivf.npz         IVF lists over the matrix rows, only with ANN_INDEX=ivf
+#   snapshot/centroids.npy   mean row of every intent, for CENTROID_TOP_N two-stage retrieval
+#   snapshot/pca.npz         PCA projection fitted on the rows, only with PCA_DIM set
+SNAPSHOT_DIR = os.environ.get(
+    'KB_SNAPSHOT_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'snapshot')
+)
+MATRIX_FILE = 'embeddings.npy'
+META_FILE = 'kb.json'
+IVF_FILE = 'ivf.npz'
+CENTROIDS_FILE = 'centroids.npy'
+PCA_FILE = 'pca.npz'
+SNAPSHOT_FORMAT = 1
+
+class Snapshot:
+    def __init__(self, meta, matrix, ivf=None, centroids=None, projection=None):
+        self.meta = meta
+        self.version = meta['version']
+        self.model_id = meta['model_id']
+        self.collections = meta['collections']
+        self._matrix = matrix
+        self._ivf = ivf
+        self._centroids = centroids
+        self._projection = projection
+
+    @property
+    def matrix(self):
+        """The stored float32 rows (memory-mapped), before any PCA_DIM or INDEX_PRECISION."""
+        return self._matrix
+
+    def embedding_index(self):
+        index = with_ann(EmbeddingIndex(self._matrix, self.meta['embedding_tags']), self._ivf)
+        index = with_prefilter(index, parts=self.meta.get('keyword_rows'))
+        index = with_centroids(index, matrix=self._centroids)
+        # INDEX_PRECISION other than float32 or PCA_DIM trade the memory-mapped file for a smaller copy
+        return quantize_index(with_projection(index, self._projection))
+
+    def bow_index(self):
+        return BowIndex.from_parts(**self.meta['bow'])
+
+    def response_map(self):
+        return self.meta['responses']
+
+def export_snapshot(out_dir, version, model_id, collections, embedding_docs, pattern_docs, response_docs):
+    os.makedirs(out_dir, exist_ok=True)
+    embedding_index = with_ann(build_embedding_index(embedding_docs))
+    embedding_index = with_prefilter(embedding_index, texts=embedding_index.texts)
+    bow_index = BowIndex(pattern_docs)
+
+    responses = {}
+    for doc in response_docs:
+        responses.setdefault(doc['intent_tag'], []).append(doc['text'])
+
+    np.save(os.path.join(out_dir, MATRIX_FILE), embedding_index.dense())
+    # Exact means of the exported rows, so the brain never has to scan the matrix for them
+    np.save(os.path.join(out_dir, CENTROIDS_FILE), compute_centroids(embedding_index))
+    meta = {
+        'format': SNAPSHOT_FORMAT,
+        'version': version,
+        'model_id': model_id,
+        'collections': collections,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'embedding_tags': embedding_index.tags.tolist(),
+        'bow': bow_index.to_parts(),
+        'responses': responses
+    }
+    ivf_path = os.path.join(out_dir, IVF_FILE)
+    if embedding_index.ann is not None:
+        embedding_index.ann.save(ivf_path)
+        meta['ann'] = embedding_index.ann.describe()
+    elif os.path.exists(ivf_path):
+        os.remove(ivf_path)
+    # The matrix stays full-size; the projection is versioned with it and applied on load
+    pca_path = os.path.join(out_dir, PCA_FILE)
+    if 0 < PCA_DIM < embedding_index.matrix.shape[1] - 1:
+        projection = fit_pca(embedding_index.matrix, PCA_DIM)
+        projection.save(pca_path)
+        meta['projection'] = projection.describe()
+    elif os.path.exists(pca_path):
+        os.remove(pca_path)
+    # Always shipped (it is small), so the prefilter can be turned on without a rebuild
+    if embedding_index.prefilter is not None:
+        meta['keyword_rows'] = embedding_index.prefilter.rows.to_parts()
+    elif embedding_index.texts is not None:
+        meta['keyword_rows'] = build_row_index(embedding_index.texts, embedding_index.tags).to_parts()
+    with open(os.path.join(out_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, separators=(',', ':'))
+    return len(embedding_index), len(bow_index)
+
+def load_projection(snapshot_dir, recorded):
+    """The snapshot's PCA projection if it is the one kb.json was built with; else None (refit)."""
+    try:
+        projection = PCAProjection.load(os.path.join(snapshot_dir, PCA_FILE))
+    except (OSError, KeyError, ValueError) as e:
+        print(f"PCA projection unavailable, refitting: {e}")
+        return None
+    if projection.version != recorded.get('version'):
+        print(f"Ignoring PCA projection {projection.version}: the snapshot was built with "
+              f"{recorded.get('version')}, refitting")
+        return None
+    return projection
+
+def load_snapshot(snapshot_dir=SNAPSHOT_DIR):
+    """Returns the bundled Snapshot, or None when the deployment has none (or an unknown format)."""
+    meta_path = os.path.join(snapshot_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('format') != SNAPSHOT_FORMAT:
+            print(f"Ignoring snapshot with format {meta.get('format')}")
+            return None
+        matrix = np.load(os.path.join(snapshot_dir, MATRIX_FILE), mmap_mode='r')
+        ivf = IVFIndex.load(os.path.join(snapshot_dir, IVF_FILE)) if 'ann' in meta else None
+        centroids_path = os.path.join(snapshot_dir, CENTROIDS_FILE)
+        centroids = np.load(centroids_path) if os.path.exists(centroids_path) else None
+        projection = load_projection(snapshot_dir, meta['projection']) if 'projection' in meta else None
+        return Snapshot(meta, matrix, ivf, centroids, projection)
+    except Exception as e:
+        print(f"Snapshot load error: {e}")
+        return None
@@ -0,0 +1,115 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Per-request stage durations. main() creates a StageTimer per execution and binds it to
+# every thread working on the request; stage()/record() called anywhere below (kb_cache,
+# the embedding call, scoring) then land in that request's timer, and are no-ops otherwise.
+_local = threading.local()
+
+def current():
+    return getattr(_local, 'timer', None)
+
+def record(name, ms):
+    timer = current()
+    if timer is not None:
+        timer.add(name, ms)
+
+@contextmanager
+def stage(name):
+    timer = current()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, (time.perf_counter() - start) * 1000)
+
+class TimedIterator:
+    """Wraps an iterator and adds the time spent waiting for its items to stage name."""
+
+    def __init__(self, iterable, name):
+        self._iterator = iter(iterable)
+        self.name = name
+        self.elapsed_ms = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            return next(self._iterator)
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            self.elapsed_ms += ms
+            record(self.name, ms)
+
+class StageTimer:
+    """Monotonic milliseconds per named stage of one request; repeated stages add up."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, ms):
+        with self._lock:
+            self.durations[name] = self.durations.get(name, 0.0) + ms
+
+    @contextmanager
+    def active(self):
+        """Makes this the current timer of the calling thread."""
+        previous = current()
+        _local.timer = self
+        try:
+            yield self
+        finally:
+            _local.timer = previous
+
+    def bind(self, fn):
+        """fn wrapped to run with this timer current, for work submitted to a thread pool."""
+        def run(*args, **kwargs):
+            with self.active():
+                return fn(*args, **kwargs)
+        return run
+
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def as_dict(self):
+        with self._lock:
+            timings = {name: round(ms, 2) for name, ms in self.durations.items()}
+        timings['total'] = round(self.total_ms(), 2)
+        return timings
+
+class LatencyStats:
+    """Rolling window of per-stage durations for one instance, rolled up into percentiles."""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.requests = 0
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, timings):
+        with self._lock:
+            self.requests += 1
+            for name, ms in timings.items():
+                self.samples.setdefault(name, deque(maxlen=self.window)).append(ms)
+
+    def percentiles(self):
+        """{stage: {'count', 'p50', 'p95', 'p99'}} over the window, in milliseconds."""
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self.samples.items()}
+        rollup = {}
+        for name, values in samples.items():
+            rollup[name] = {'count': len(values)}
+            for p in (50, 95, 99):
+                # Nearest-rank percentile
+                rank = max(0, min(len(values) - 1, -(-p * len(values) // 100) - 1))
+                rollup[name][f'p{p}'] = round(values[rank], 2)
+        return rollup
@@ -1,17 +1,20 @@
 import os
-import json
 import time
-from huggingface_hub import InferenceClient
 from appwrite.client import Client
 from appwrite.services.databases import Databases
 from appwrite.query import Query
 from dotenv import load_dotenv
+from appwrite_functions.chatbot_brain.src.embedding_codec import encode_embedding, decode_embedding
+from appwrite_functions.chatbot_brain.src.centroids import shift_centroid
+from appwrite_functions.chatbot_brain.src.kb_loader import iter_documents, list_all_documents
+from appwrite_functions.chatbot_brain.src.nlp_engine import get_embedding_provider
 
 load_dotenv()
 
 # Configuration
 HF_API_TOKEN = os.getenv('HF_API_TOKEN')
-MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'hf')
+EMBEDDING_ENCODING = os.getenv('EMBEDDING_ENCODING', 'f16')
 
 endpoint = os.getenv('APPWRITE_ENDPOINT')
 project_id = os.getenv('APPWRITE_PROJECT_ID')
@@ -24,30 +27,25 @@ client.set_project(project_id)
 client.set_key(api_key)
 
 databases = Databases(client)
-hf_client = InferenceClient(model=MODEL_ID, token=HF_API_TOKEN)
+embedding_provider = get_embedding_provider(EMBEDDING_BACKEND, HF_API_TOKEN)
 
 def get_embedding(text):
     try:
-        # returns a list or numpy array of floats
-        vector = hf_client.feature_extraction(text)
-        # convert to list if it's a numpy array for json serialization
-        if hasattr(vector, 'tolist'):
-            return vector.tolist()
-        return vector
+        return embedding_provider.embed(text)
     except Exception as e:
-        print(f"Error from HF SDK: {e}")
+        print(f"Error from {EMBEDDING_BACKEND} embedder: {e}")
         return None
 
 def backfill_embeddings():
     print("Fetching all patterns...")
     # List patterns
-    patterns_resp = databases.list_documents(database_id, 'patterns', [Query.limit(5000)])
-    patterns = patterns_resp['documents']
+    patterns = list_all_documents(databases, database_id, 'patterns', select=['text', 'intent_tag'])
     print(f"Found {len(patterns)} patterns.")
 
     # List existing embeddings to avoid duplicates
-    existing_resp = databases.list_documents(database_id, 'embeddings', [Query.limit(5000)])
-    existing_texts = {e['pattern_text'] for e in existing_resp['documents']}
+    existing_texts = {e['pattern_text'] for e in iter_documents(databases, database_id, 'embeddings', [
+        Query.equal('model', embedding_provider.model_id)
+    ], select=['pattern_text'])}
     print(f"Found {len(existing_texts)} existing embeddings.")
 
     for p in patterns:
@@ -61,23 +59,53 @@ def backfill_embeddings():
         print(f"Generating embedding for: {text}")
         vector = get_embedding(text)
         
-        if vector:
+        if vector is not None:
             try:
                 databases.create_document(database_id, 'embeddings', 'unique()', {
                     'intent_tag': tag,
                     'pattern_text': text,
-                    'embedding': json.dumps(vector),
-                    'model': MODEL_ID
+                    'embedding': encode_embedding(vector, EMBEDDING_ENCODING),
+                    'model': embedding_provider.model_id
                 })
                 print(f"Stored embedding for: {text}")
             except Exception as e:
                 print(f"Error storing embedding: {e}")
             
             # Rate limiting for free tier
-            time.sleep(0.5)
+            if EMBEDDING_BACKEND == 'hf':
+                time.sleep(0.5)
+
+def rebuild_centroids():
+    # Recomputes every intent centroid from scratch; proxy.py keeps them current afterwards
+    model_id = embedding_provider.model_id
+    print(f"Rebuilding intent centroids for {model_id}...")
+    centroids = {}
+    for doc in iter_documents(databases, database_id, 'embeddings', [
+        Query.equal('model', model_id)
+    ], select=['intent_tag', 'embedding']):
+        mean, count = centroids.get(doc['intent_tag'], (None, 0))
+        centroids[doc['intent_tag']] = shift_centroid(mean, count, decode_embedding(doc['embedding']))
+
+    existing_ids = {doc['intent_tag']: doc['$id'] for doc in iter_documents(databases, database_id, 'centroids', [
+        Query.equal('model', model_id)
+    ], select=['intent_tag'])}
+    for tag, (mean, count) in centroids.items():
+        data = {'embedding': encode_embedding(mean, 'f32'), 'count': count}
+        try:
+            if tag in existing_ids:
+                databases.update_document(database_id, 'centroids', existing_ids.pop(tag), data)
+            else:
+                databases.create_document(database_id, 'centroids', 'unique()', dict(data, intent_tag=tag, model=model_id))
+        except Exception as e:
+            print(f"Error storing centroid for {tag}: {e}")
+    # Intents that no longer have any embedding
+    for doc_id in existing_ids.values():
+        databases.delete_document(database_id, 'centroids', doc_id)
+    print(f"Stored {len(centroids)} centroids.")
 
 if __name__ == "__main__":
-    if not HF_API_TOKEN:
+    if EMBEDDING_BACKEND == 'hf' and not HF_API_TOKEN:
         print("HF_API_TOKEN not found in environment.")
     else:
         backfill_embeddings()
+        rebuild_centroids()
@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+from appwrite_functions.chatbot_brain.src.nlp_engine import EmbeddingIndex, rank_intents
+from appwrite_functions.chatbot_brain.src.ann_index import IVFIndex, build_ivf
+from appwrite_functions.chatbot_brain.src.centroids import IntentCentroids, compute_centroids
+
+# Recall and latency of the IVF index and of two-stage intent-centroid retrieval against
+# the exact scan on a synthetic KB shaped like ours: many intents, each a cluster of
+# paraphrase embeddings. Queries are fresh paraphrases, so the exact scan is the reference.
+# Usage: python bench_ann.py [rows] [dim] [patterns per intent]
+
+NPROBES = [1, 2, 4, 8, 16, 32, 64]
+CENTROID_TOP_NS = [1, 2, 5, 10, 20, 50]
+N_QUERIES = 300
+TOP_K = 10
+
+def synthetic_kb(n_rows, dim, per_intent, seed=0):
+    rng = np.random.default_rng(seed)
+    n_intents = max(1, n_rows // per_intent)
+    centers = rng.standard_normal((n_intents, dim)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+
+    def paraphrases(intent_ids):
+        # Noise of this size puts paraphrases of one intent around cosine 0.6-0.7
+        vectors = centers[intent_ids] + 0.9 * rng.standard_normal((len(intent_ids), dim)) / np.sqrt(dim)
+        # float32 like a real index; float64 would go through the widening path in scores()
+        return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+    intent_ids = rng.integers(0, n_intents, size=n_rows)
+    tags = [f"intent_{i}" for i in intent_ids]
+    queries = paraphrases(rng.integers(0, n_intents, size=N_QUERIES))
+    return EmbeddingIndex(paraphrases(intent_ids), tags), queries
+
+def exact_rows(index, query):
+    scores = index.matrix @ query
+    return set(np.argpartition(scores, -TOP_K)[-TOP_K:].tolist())
+
+def time_queries(index, queries):
+    start = time.perf_counter()
+    results = [rank_intents(query, index, top_k=5) for query in queries]
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 384
+    per_intent = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    index, queries = synthetic_kb(n_rows, dim, per_intent)
+    print(f"{n_rows} rows x {dim} dims, {len(index.intent_tags)} intents, {len(queries)} queries")
+
+    start = time.perf_counter()
+    ivf = build_ivf(index.matrix)
+    build_s = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ivf.npz')
+        ivf.save(path)
+        size_mb = os.path.getsize(path) / 1e6
+        ivf = IVFIndex.load(path)
+    print(f"IVF: {ivf.n_lists} lists, built in {build_s:.1f}s, {size_mb:.1f} MB serialized")
+
+    exact, exact_ms = time_queries(index, queries)
+    reference_rows = [exact_rows(index, query) for query in queries]
+    print(f"\n{'nprobe':>7}{'scanned':>9}{'top-1 intent':>14}{f'recall@{TOP_K}':>11}{'ms/query':>10}{'speedup':>9}")
+    print(f"{'exact':>7}{'100.0%':>9}{'100.0%':>14}{'100.0%':>11}{exact_ms:>10.2f}{'1.0x':>9}")
+
+    index.ann = ivf
+    for nprobe in NPROBES:
+        if nprobe > ivf.n_lists:
+            break
+        ivf.nprobe = nprobe
+        approx, approx_ms = time_queries(index, queries)
+        top1 = np.mean([a[0][0] == e[0][0] for a, e in zip(approx, exact)])
+        recall = np.mean([len(set(ivf.search(q).tolist()) & ref) / TOP_K for q, ref in zip(queries, reference_rows)])
+        scanned = np.mean([len(ivf.search(q)) for q in queries[:50]]) / n_rows
+        print(f"{nprobe:>7}{scanned:>9.1%}{top1:>14.1%}{recall:>11.1%}{approx_ms:>10.2f}{exact_ms / approx_ms:>8.1f}x")
+
+    index.ann = None
+    centroids = compute_centroids(index)
+    centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)
+    index.centroids = IntentCentroids(centroids)
+    print(f"\n{'top_n':>7}{'scanned':>9}{'top-1 intent':>14}{'recall@5':>11}{'ms/query':>10}{'speedup':>9}")
+    for top_n in CENTROID_TOP_NS:
+        if top_n > len(centroids):
+            break
+        index.centroids.top_n = top_n
+        approx, approx_ms = time_queries(index, queries)
+        top1 = np.mean([a[0][0] == e[0][0] for a, e in zip(approx, exact)])
+        # Share of the exact top-5 intents whose patterns the centroid stage lets through
+        recall = np.mean([len({t for t, _ in e[:5]} & set(index.intent_tags[index.centroids.search(q)])) / len(e[:5])
+                          for q, e in zip(queries, exact)])
+        scanned = np.mean([len(index.intent_rows(index.centroids.search(q))) for q in queries[:50]]) / n_rows
+        print(f"{top_n:>7}{scanned:>9.1%}{top1:>14.1%}{recall:>11.1%}{approx_ms:>10.2f}{exact_ms / approx_ms:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import os
+import ssl
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import warnings
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+import urllib3
+from appwrite.client import Client
+from appwrite.services.databases import Databases
+from appwrite_functions.chatbot_brain.src.clients import get_databases, install_pool, uninstall_pool
+
+# What a warm brain invocation saves by keeping its Appwrite client and connections: each
+# simulated request makes --calls list_documents calls (KB version check, settings, log
+# write...) against a local HTTPS server standing in for Appwrite, once with a fresh
+# Client per request on the SDK's one-connection-per-call transport, once with the
+# module-scoped pooled client. --rtt-ms adds a network round trip per call and two per new
+# connection (TCP + TLS 1.3 handshake), to approximate a container far from the Appwrite region.
+# Usage: python bench_clients.py [--requests 200] [--calls 3] [--rtt-ms 0]
+
+class CountingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler, rtt_ms):
+        super().__init__(address, handler)
+        self.rtt_ms = rtt_ms
+        self.connections = 0
+        self.lock = threading.Lock()
+
+class AppwriteStub(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle on, delayed ACKs add ~40 ms
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+        time.sleep(2 * self.server.rtt_ms / 1000)
+
+    def do_GET(self):
+        time.sleep(self.server.rtt_ms / 1000)
+        body = json.dumps({'total': 0, 'documents': []}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(rtt_ms, workdir):
+    server = CountingServer(('127.0.0.1', 0), AppwriteStub, rtt_ms)
+    scheme = 'http'
+    if shutil.which('openssl'):
+        cert, key = os.path.join(workdir, 'cert.pem'), os.path.join(workdir, 'key.pem')
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-keyout', key, '-out', cert,
+                        '-days', '1', '-subj', '/CN=127.0.0.1'], check=True, capture_output=True)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = 'https'
+    else:
+        print("openssl not found; measuring plain HTTP (TCP handshakes only)")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'{scheme}://127.0.0.1:{server.server_address[1]}/v1'
+
+def run(server, n_requests, n_calls, make_databases):
+    latencies = []
+    before = server.connections
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        databases = make_databases()
+        for _ in range(n_calls):
+            databases.list_documents('nwu_chatbot_db', 'settings')
+        latencies.append((time.perf_counter() - start) * 1000)
+    values = np.asarray(latencies)
+    return {
+        'mean_ms': round(float(values.mean()), 3),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p95_ms': round(float(np.percentile(values, 95)), 3),
+        'connections_per_request': round((server.connections - before) / n_requests, 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-request cost of fresh vs reused Appwrite clients')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--calls', type=int, default=3, help='Appwrite calls per request')
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    args = parser.parse_args()
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    # The SDK forces its list_documents deprecation warning on for every call
+    warnings.showwarning = lambda *args, **kwargs: None
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server, endpoint = start_server(args.rtt_ms, workdir)
+
+        def fresh():
+            # What main() did before: a new Client per invocation, SDK default transport
+            client = Client().set_endpoint(endpoint).set_project('bench').set_key('key').set_self_signed(True)
+            return Databases(client)
+
+        def pooled():
+            databases = get_databases(endpoint, 'bench', 'key')
+            databases.client.set_self_signed(True)
+            return databases
+
+        uninstall_pool()
+        run(server, 5, args.calls, fresh)
+        results = {'fresh_client': run(server, args.requests, args.calls, fresh)}
+        install_pool()
+        run(server, 5, args.calls, pooled)
+        results['pooled_client'] = run(server, args.requests, args.calls, pooled)
+        server.shutdown()
+
+    print(f"{args.requests} requests x {args.calls} Appwrite calls, {endpoint.split(':')[0]}, rtt {args.rtt_ms:g} ms")
+    print(f"{'':>15}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'conns/req':>11}")
+    for name, r in results.items():
+        print(f"{name:>15}{r['mean_ms']:>10.2f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}"
+              f"{r['connections_per_request']:>11.2f}")
+    saved = results['fresh_client']['mean_ms'] - results['pooled_client']['mean_ms']
+    print(f"Saved per warm request: {saved:.2f} ms "
+          f"({saved / results['fresh_client']['mean_ms']:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+import tracemalloc
+import numpy as np
+from appwrite_functions.chatbot_brain.src.embedding_codec import encode_embedding
+from appwrite_functions.chatbot_brain.src.nlp_engine import (
+    build_embedding_index, predict_intent_semantic, predict_intents_semantic, predict_intent_bow, BowIndex
+)
+
+# Offline speed benchmark of the NLP engine on synthetic KBs of growing size. Patterns
+# are data/intents.json multiplied with paraphrase noise (intents cloned under new tags
+# until the KB is big enough); vectors are random 384-d points clustered per intent.
+# Everything is shaped like the Appwrite documents the brain downloads, but stays in memory.
+#
+# Usage: python bench_engine.py [--sizes 1000,10000,50000] [--queries 500] [--out bench.json]
+#                               [--compare previous.json]
+# Commit the JSON next to a change (or keep it from a CI run) to diff later runs against it.
+
+DIM = 384
+FILLERS = ['please', 'pls', 'hi', 'hello', 'so', 'um', 'i want to know', 'can you tell me', 'quick question']
+SUFFIXES = ['?', '??', '.', '!', ' please', ' thanks', ' at nwu', ' for this session']
+
+def load_intents(path='data/intents.json'):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['intents']
+
+def paraphrase(text, rng):
+    """Word dropout, a swapped pair, a typo and filler words: the noise real questions carry."""
+    words = text.split()
+    if len(words) > 3 and rng.random() < 0.3:
+        del words[rng.randrange(len(words))]
+    if len(words) > 2 and rng.random() < 0.3:
+        i = rng.randrange(len(words) - 1)
+        words[i], words[i + 1] = words[i + 1], words[i]
+    if words and rng.random() < 0.3:
+        i = rng.randrange(len(words))
+        word = words[i]
+        if len(word) > 3:
+            j = rng.randrange(len(word) - 1)
+            words[i] = word[:j] + word[j + 1] + word[j] + word[j + 2:]
+    if rng.random() < 0.4:
+        words.insert(0, rng.choice(FILLERS))
+    return ' '.join(words) + (rng.choice(SUFFIXES) if rng.random() < 0.5 else '')
+
+def synthetic_kb(n_patterns, seed=0):
+    """
+    Returns (pattern_docs, embedding_docs, queries) where queries are (text, vector, intent)
+    paraphrases of random patterns, with vectors drawn near their intent's centre.
+    """
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    intents = load_intents()
+    per_intent = max(1, round(sum(len(i['patterns']) for i in intents) / len(intents)))
+    n_intents = max(len(intents), n_patterns // max(per_intent, 8))
+
+    centres = np_rng.standard_normal((n_intents, DIM)).astype(np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+
+    def near(intent, spread=0.8):
+        vector = centres[intent] + spread * np_rng.standard_normal(DIM).astype(np.float32) / np.sqrt(DIM)
+        return vector / np.linalg.norm(vector)
+
+    pattern_docs, embedding_docs, sources = [], [], []
+    for n in range(n_patterns):
+        intent = n % n_intents
+        base = intents[intent % len(intents)]
+        tag = base['tag'] if intent < len(intents) else f"{base['tag']}_{intent // len(intents)}"
+        text = rng.choice(base['patterns'])
+        text = text if n < n_intents * len(base['patterns']) and rng.random() < 0.5 else paraphrase(text, rng)
+        doc_id = f'{n:08x}'
+        meta = {'$createdAt': '2025-01-01T00:00:00.000+00:00', '$updatedAt': '2025-01-01T00:00:00.000+00:00',
+                '$permissions': [], '$databaseId': 'nwu_chatbot_db'}
+        pattern_docs.append(dict(meta, **{'$id': f'p{doc_id}', '$collectionId': 'patterns',
+                                          'text': text, 'intent_tag': tag}))
+        embedding_docs.append(dict(meta, **{'$id': f'e{doc_id}', '$collectionId': 'embeddings',
+                                            'intent_tag': tag, 'pattern_text': text,
+                                            'embedding': encode_embedding(near(intent), 'f16'),
+                                            'model': 'sentence-transformers/all-MiniLM-L6-v2'}))
+        sources.append((text, intent, tag))
+
+    def queries(count):
+        picked = [sources[rng.randrange(len(sources))] for _ in range(count)]
+        return [(paraphrase(text, rng), near(intent), tag) for text, intent, tag in picked]
+
+    return pattern_docs, embedding_docs, queries
+
+def percentiles(samples_ms):
+    values = np.asarray(samples_ms)
+    return {f'p{p}': round(float(np.percentile(values, p)), 4) for p in (50, 95, 99)}
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+def measure_queries(fn, queries):
+    latencies = []
+    hits = 0
+    start = time.perf_counter()
+    for query in queries:
+        t = time.perf_counter()
+        hits += fn(query)
+        latencies.append((time.perf_counter() - t) * 1000)
+    elapsed = time.perf_counter() - start
+    return dict(percentiles(latencies), qps=round(len(queries) / elapsed, 1),
+                accuracy=round(hits / len(queries), 4))
+
+def bench_size(n_patterns, n_queries, threshold):
+    pattern_docs, embedding_docs, make_queries = synthetic_kb(n_patterns)
+    queries = make_queries(n_queries)
+    result = {'patterns': n_patterns}
+
+    tracemalloc.start()
+    embedding_index, result['semantic_build_ms'] = timed(build_embedding_index, embedding_docs)
+    result['semantic_build_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+    tracemalloc.reset_peak()
+    result['semantic'] = measure_queries(
+        lambda q: predict_intent_semantic(q[1], embedding_index, threshold)[0] == q[2], queries)
+    result['semantic']['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+
+    tracemalloc.reset_peak()
+    vectors = [q[1] for q in queries]
+    _, batch_ms = timed(predict_intents_semantic, vectors, embedding_index, threshold)
+    result['semantic_batch'] = {
+        'ms_per_query': round(batch_ms / len(queries), 4),
+        'qps': round(len(queries) / (batch_ms / 1000), 1),
+        'peak_mb': round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+    }
+
+    tracemalloc.reset_peak()
+    bow_index, result['bow_build_ms'] = timed(BowIndex, pattern_docs)
+    result['bow_build_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+    tracemalloc.reset_peak()
+    result['bow'] = measure_queries(lambda q: predict_intent_bow(q[0], bow_index, threshold)[0] == q[2], queries)
+    result['bow']['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+    tracemalloc.stop()
+
+    for key in ('semantic_build_ms', 'bow_build_ms'):
+        result[key] = round(result[key], 2)
+    return result
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(current, previous):
+    """Prints the relative change of the headline numbers against an earlier run."""
+    before = {r['patterns']: r for r in previous['results']}
+    print(f"\nvs {previous.get('commit')} ({previous.get('created_at')}):")
+    for r in current['results']:
+        old = before.get(r['patterns'])
+        if not old:
+            continue
+        changes = []
+        for path in (('semantic', 'p50'), ('semantic', 'p95'), ('semantic_batch', 'ms_per_query'),
+                     ('bow', 'p50'), ('bow', 'p95'), ('semantic_build_ms',), ('bow_build_ms',)):
+            a, b = old, r
+            for key in path:
+                a, b = a.get(key), b.get(key)
+            if a:
+                changes.append(f"{'.'.join(path)} {(b - a) / a:+.0%}")
+        print(f"  {r['patterns']:>7} patterns: " + ', '.join(changes))
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline NLP engine benchmark')
+    parser.add_argument('--sizes', default='1000,10000,50000')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--out', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='earlier JSON results to compare against')
+    args = parser.parse_args()
+
+    report = {
+        'commit': git_commit(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'queries': args.queries,
+        'results': []
+    }
+    print(f"{'patterns':>9}{'sem p50':>9}{'sem p95':>9}{'sem qps':>9}{'batch qps':>11}"
+          f"{'bow p50':>9}{'bow p95':>9}{'bow qps':>9}{'build ms':>10}{'peak MB':>9}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        r = bench_size(size, args.queries, args.threshold)
+        report['results'].append(r)
+        peak = max(r['semantic_build_peak_mb'], r['semantic']['peak_mb'], r['bow_build_peak_mb'])
+        print(f"{size:>9}{r['semantic']['p50']:>9.3f}{r['semantic']['p95']:>9.3f}{r['semantic']['qps']:>9.0f}"
+              f"{r['semantic_batch']['qps']:>11.0f}{r['bow']['p50']:>9.3f}{r['bow']['p95']:>9.3f}"
+              f"{r['bow']['qps']:>9.0f}{r['semantic_build_ms'] + r['bow_build_ms']:>10.0f}{peak:>9.1f}")
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.out}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import sys
+import time
+import random
+import numpy as np
+from appwrite_functions.chatbot_brain.src.nlp_engine import (
+    LocalEmbeddingProvider, EmbeddingIndex, PRECISIONS, build_embedding_index, quantize_index,
+    normalize_query, rank_intents, rank_intents_batch
+)
+from bench_engine import load_intents, paraphrase, synthetic_kb
+
+# Recall and latency of the float16 / int8 index precisions (INDEX_PRECISION) against
+# float32. Part 1 uses our intents: data/intents.json patterns and noisy paraphrases of
+# them as queries, embedded with the local embedder (no HF call needed), so it shows
+# whether any answer would change. Part 2 repeats it on a synthetic KB of [rows] patterns,
+# where the matrix is big enough for memory and scoring time to matter.
+# Usage: python bench_quantization.py [rows] [queries]
+
+TOP_K = 5
+THRESHOLD = 0.5
+
+def copy_index(index):
+    return EmbeddingIndex(index.matrix.copy(), index.tags, index.texts)
+
+def timed_ms(fn, repeat):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+def compare(index, queries, repeat):
+    """One row per precision: agreement with float32, score error, latency, memory."""
+    reference = [rank_intents(q, index, TOP_K) for q in queries]
+    base_bytes = index.matrix.nbytes
+    rows = []
+    for precision in PRECISIONS:
+        quantized = quantize_index(copy_index(index), precision)
+        ranked = [rank_intents(q, quantized, TOP_K) for q in queries]
+        top1 = np.mean([r[0][0] == q[0][0] for r, q in zip(reference, ranked)])
+        recall = np.mean([len({t for t, _ in r} & {t for t, _ in q}) / len(r) for r, q in zip(reference, ranked)])
+        # Does the answer change, counting "below threshold" as an answer too?
+        decided = np.mean([(r[0][0] if r[0][1] >= THRESHOLD else None) == (q[0][0] if q[0][1] >= THRESHOLD else None)
+                           for r, q in zip(reference, ranked)])
+        error = max(abs(r[0][1] - q[0][1]) for r, q in zip(reference, ranked))
+        single = timed_ms(lambda: [rank_intents(q, quantized, TOP_K) for q in queries[:50]], repeat) / min(50, len(queries))
+        batch = timed_ms(lambda: rank_intents_batch(queries, quantized, TOP_K), repeat) / len(queries)
+        memory = quantized.matrix.nbytes + (quantized.scales.nbytes if quantized.scales is not None else 0)
+        rows.append((precision, top1, recall, decided, error, single, batch, memory / base_bytes, memory / 1e6))
+    print(f"{'precision':>10}{'top-1':>8}{'recall@5':>10}{'answer':>8}{'max err':>9}"
+          f"{'ms/query':>10}{'batch ms/q':>12}{'memory':>8}{'MB':>8}")
+    for precision, top1, recall, decided, error, single, batch, ratio, mb in rows:
+        print(f"{precision:>10}{top1:>8.1%}{recall:>10.1%}{decided:>8.1%}{error:>9.4f}"
+              f"{single:>10.3f}{batch:>12.4f}{ratio:>8.0%}{mb:>8.2f}")
+
+def intents_kb(n_queries, seed=0):
+    rng = random.Random(seed)
+    embedder = LocalEmbeddingProvider()
+    intents = load_intents()
+    patterns = [(p, i['tag']) for i in intents for p in i['patterns']]
+    vectors = embedder.embed_batch([p for p, _ in patterns])
+    index = EmbeddingIndex(vectors.astype(np.float32), [t for _, t in patterns], [p for p, _ in patterns])
+    texts = [paraphrase(rng.choice(patterns)[0], rng) for _ in range(n_queries)]
+    queries = np.stack([normalize_query(v, index.matrix.shape[1]) for v in embedder.embed_batch(texts)])
+    return index, queries
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    index, queries = intents_kb(n_queries)
+    print(f"data/intents.json: {len(index)} patterns, {len(index.intent_tags)} intents, "
+          f"{len(queries)} paraphrased queries (local embedder)")
+    compare(index, queries, repeat=5)
+
+    _, embedding_docs, make_queries = synthetic_kb(n_rows)
+    index = build_embedding_index(embedding_docs)
+    queries = np.stack([q[1] for q in make_queries(min(n_queries, 200))]).astype(np.float32)
+    print(f"\nSynthetic KB: {len(index)} patterns, {len(index.intent_tags)} intents, {len(queries)} queries")
+    compare(index, queries, repeat=2)
+
+if __name__ == "__main__":
+    main()
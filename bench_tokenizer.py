@@ -0,0 +1,91 @@
+import sys
+import json
+import time
+import appwrite_functions.chatbot_brain.src.nlp_engine as nlp_engine
+from appwrite_functions.chatbot_brain.src.nlp_engine import BowIndex, clean_up_sentence, stem_word
+
+# Checks that TOKENIZER=fast gives the same BoW matches as the NLTK tokenizer on the
+# intents in data/intents.json (patterns plus typo/punctuation/casing variants of each),
+# then times both tokenizers on the same sentences.
+# Usage: python bench_tokenizer.py [intents.json] [threshold]
+
+def load_patterns(path):
+    with open(path, encoding='utf-8') as f:
+        intents = json.load(f)['intents']
+    return [{'text': text, 'intent_tag': intent['tag']} for intent in intents for text in intent['patterns']]
+
+def variants(text):
+    """The kinds of rewrites students actually type around a known pattern."""
+    yield text
+    yield text.lower()
+    yield text.upper()
+    yield text.rstrip('?.!') + '?'
+    yield f'Please, {text.lower()}!!'
+    yield f'"{text}" - can you help me?'
+    yield f"I don't know: {text} (it's urgent)..."
+    yield text.replace(' ', '  ')
+
+def build_index(patterns, tokenizer):
+    nlp_engine.TOKENIZER = tokenizer
+    try:
+        return BowIndex(patterns)
+    finally:
+        nlp_engine.TOKENIZER = 'nltk'
+
+def compare(patterns, threshold=0.5):
+    indexes = {mode: build_index(patterns, mode) for mode in ('nltk', 'fast')}
+    queries = [query for p in patterns for query in variants(p['text'])]
+
+    mismatches = []
+    for query in queries:
+        tokens = {mode: clean_up_sentence(query, mode) for mode in indexes}
+        results = {}
+        for mode, index in indexes.items():
+            nlp_engine.TOKENIZER = mode
+            try:
+                results[mode] = index.rank_intents(query, top_k=1)
+            finally:
+                nlp_engine.TOKENIZER = 'nltk'
+        nltk_best = results['nltk'][0] if results['nltk'] else (None, 0.0)
+        fast_best = results['fast'][0] if results['fast'] else (None, 0.0)
+        same_match = (nltk_best[1] >= threshold) == (fast_best[1] >= threshold)
+        if nltk_best[1] >= threshold:
+            same_match = same_match and nltk_best[0] == fast_best[0]
+        if not same_match or abs(nltk_best[1] - fast_best[1]) > 1e-9:
+            mismatches.append((query, tokens['nltk'], tokens['fast'], nltk_best, fast_best))
+    return queries, mismatches
+
+def time_tokenizer(queries, tokenizer, rounds=5):
+    # Warm the stem cache and, for nltk, the lazy imports, so only steady-state cost is timed
+    for query in queries:
+        clean_up_sentence(query, tokenizer)
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for query in queries:
+            clean_up_sentence(query, tokenizer)
+        best = min(best, time.perf_counter() - start)
+    return best / len(queries) * 1e6
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else 'data/intents.json'
+    threshold = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    patterns = load_patterns(path)
+    queries, mismatches = compare(patterns, threshold)
+
+    print(f"{len(patterns)} patterns, {len(queries)} queries compared")
+    for query, nltk_tokens, fast_tokens, nltk_best, fast_best in mismatches[:20]:
+        print(f"  MISMATCH {query!r}\n    nltk {nltk_tokens} -> {nltk_best}\n    fast {fast_tokens} -> {fast_best}")
+
+    stem_word.cache_clear()
+    nltk_us = time_tokenizer(queries, 'nltk')
+    fast_us = time_tokenizer(queries, 'fast')
+    print(f"clean_up_sentence  nltk {nltk_us:.1f}us  fast {fast_us:.1f}us  ({nltk_us / fast_us:.1f}x)")
+
+    if mismatches:
+        print(f"{len(mismatches)} queries match differently")
+        sys.exit(1)
+    print("BoW matches identical for both tokenizers.")
+
+if __name__ == "__main__":
+    main()
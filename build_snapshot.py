@@ -0,0 +1,61 @@
+import os
+import time
+from appwrite.client import Client
+from appwrite.services.databases import Databases
+from appwrite.query import Query
+from dotenv import load_dotenv
+from appwrite_functions.chatbot_brain.src.nlp_engine import get_embedding_provider
+from appwrite_functions.chatbot_brain.src.snapshot import export_snapshot, SNAPSHOT_DIR
+from appwrite_functions.chatbot_brain.src.kb_loader import iter_documents, list_all_documents
+
+load_dotenv()
+
+# Exports the KB into appwrite_functions/chatbot_brain/snapshot so a cold brain
+# can answer from the bundled files instead of downloading every collection.
+endpoint = os.getenv('APPWRITE_ENDPOINT')
+project_id = os.getenv('APPWRITE_PROJECT_ID')
+api_key = os.getenv('APPWRITE_API_KEY')
+database_id = os.getenv('APPWRITE_DATABASE_ID', 'nwu_chatbot_db')
+
+COLLECTIONS = {
+    'embeddings': 'embeddings',
+    'patterns': os.getenv('APPWRITE_COLLECTION_PATTERNS', 'patterns'),
+    'responses': os.getenv('APPWRITE_COLLECTION_RESPONSES', 'responses'),
+}
+KB_VERSION_KEY = 'kb_version'
+
+client = Client()
+client.set_endpoint(endpoint)
+client.set_project(project_id)
+client.set_key(api_key)
+
+databases = Databases(client)
+
+def get_or_create_kb_version():
+    docs = databases.list_documents(database_id, 'settings', [Query.equal('key', KB_VERSION_KEY)])
+    if docs['documents']:
+        return docs['documents'][0]['value']
+    # Without a marker the brain cannot tell whether the snapshot is current
+    version = str(time.time_ns())
+    databases.create_document(database_id, 'settings', 'unique()', {'key': KB_VERSION_KEY, 'value': version})
+    return version
+
+def build_snapshot(out_dir=SNAPSHOT_DIR):
+    # Read the marker before the data: an edit during the export bumps it and the
+    # brain then sees a stale snapshot and falls back to live queries
+    version = get_or_create_kb_version()
+    model_id = get_embedding_provider(os.getenv('EMBEDDING_BACKEND')).model_id
+    print(f"Building KB snapshot version {version} for model {model_id}...")
+
+    # Embeddings and patterns stream straight into the index builders
+    embeddings = iter_documents(databases, database_id, COLLECTIONS['embeddings'], [
+        Query.equal('model', model_id)
+    ], select=['intent_tag', 'embedding', 'pattern_text'])
+    patterns = iter_documents(databases, database_id, COLLECTIONS['patterns'], select=['text', 'intent_tag'])
+    responses = list_all_documents(databases, database_id, COLLECTIONS['responses'], select=['text', 'intent_tag'])
+
+    n_vectors, n_patterns = export_snapshot(out_dir, version, model_id, COLLECTIONS, embeddings, patterns, responses)
+    print(f"Snapshot written to {out_dir}: {n_vectors} vectors, {n_patterns} patterns, {len(responses)} responses")
+
+if __name__ == "__main__":
+    build_snapshot()
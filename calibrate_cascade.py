@@ -0,0 +1,79 @@
+import sys
+import json
+import numpy as np
+from appwrite_functions.chatbot_brain.src.nlp_engine import BowIndex, bow_margin
+
+# Picks BOW_FIRST_CONFIDENCE / BOW_FIRST_MARGIN for the brain's BoW-first cascade: the
+# lowest bar at which a BoW answer agrees with the expected intent at least
+# target_precision of the time, i.e. the most HuggingFace calls skipped safely.
+#
+# Without a labeled file every pattern in data/intents.json is held out in turn and
+# matched against the rest. A JSONL export of the logs collection ({"query", "intent_tag"}
+# per line, answered by the semantic matcher) calibrates against real traffic instead.
+# Usage: python calibrate_cascade.py [target_precision] [labeled.jsonl]
+
+CONFIDENCES = np.round(np.arange(0.5, 1.001, 0.05), 2)
+MARGINS = np.round(np.arange(0.0, 0.501, 0.05), 2)
+
+def load_patterns(path='data/intents.json'):
+    with open(path, encoding='utf-8') as f:
+        intents = json.load(f)['intents']
+    return [{'text': text, 'intent_tag': intent['tag']} for intent in intents for text in intent['patterns']]
+
+def held_out_predictions(patterns):
+    predictions = []
+    for i, pattern in enumerate(patterns):
+        index = BowIndex(patterns[:i] + patterns[i + 1:])
+        tag, score, margin = bow_margin(pattern['text'], index)
+        predictions.append((tag == pattern['intent_tag'], score, margin))
+    return predictions
+
+def labeled_predictions(path, patterns):
+    index = BowIndex(patterns)
+    predictions = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get('intent_tag') in (None, 'unknown'):
+                continue
+            tag, score, margin = bow_margin(record['query'], index)
+            predictions.append((tag == record['intent_tag'], score, margin))
+    return predictions
+
+def calibrate(predictions, target_precision=0.95):
+    """Returns (confidence, margin, coverage, precision) with the best coverage at target precision."""
+    correct = np.array([p[0] for p in predictions], dtype=bool)
+    scores = np.array([p[1] for p in predictions])
+    margins = np.array([p[2] for p in predictions])
+    best = None
+    for confidence in CONFIDENCES:
+        for margin in MARGINS:
+            taken = (scores >= confidence) & (margins >= margin)
+            if not taken.any():
+                continue
+            precision = correct[taken].mean()
+            coverage = taken.mean()
+            if precision >= target_precision and (best is None or coverage > best[2]):
+                best = (float(confidence), float(margin), float(coverage), float(precision))
+    return best
+
+def main():
+    target = float(sys.argv[1]) if len(sys.argv) > 1 else 0.95
+    labeled = sys.argv[2] if len(sys.argv) > 2 else None
+
+    patterns = load_patterns()
+    predictions = labeled_predictions(labeled, patterns) if labeled else held_out_predictions(patterns)
+    print(f"{len(predictions)} queries, BoW top-1 accuracy {np.mean([p[0] for p in predictions]):.1%}")
+
+    best = calibrate(predictions, target)
+    if best is None:
+        print(f"No bar reaches {target:.0%} precision; keep the cascade off (CASCADE=semantic_first)")
+        sys.exit(1)
+    confidence, margin, coverage, precision = best
+    print(f"BOW_FIRST_CONFIDENCE={confidence} BOW_FIRST_MARGIN={margin}")
+    print(f"  skips the semantic call on {coverage:.1%} of queries at {precision:.1%} precision")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+import random
+import argparse
+import numpy as np
+from appwrite_functions.chatbot_brain.src.nlp_engine import (
+    LocalEmbeddingProvider, EmbeddingIndex, build_embedding_index, normalize_query, rank_intents
+)
+from appwrite_functions.chatbot_brain.src.projection import with_projection
+from appwrite_functions.chatbot_brain.src.snapshot import SNAPSHOT_DIR, load_snapshot
+from bench_engine import load_intents, paraphrase, synthetic_kb
+from bench_quantization import timed_ms
+
+# Does a PCA-projected index (PCA_DIM) still give the answers the full vectors give?
+# Each KB is ranked with the full vectors and with projections to DIMS, comparing the
+# top-1 intent and the answer (the top-1 intent if it clears --threshold, else "fall
+# back to BoW"). The check fails if either changes for more than --tolerance of the
+# queries at the configured PCA_DIM (64 when unset) on a gated KB:
+#   intents   data/intents.json patterns plus --augment paraphrases of each (local
+#             embedder, no HF call), queried with fresh paraphrases
+#   snapshot  the stored embeddings of a build_snapshot.py export (--snapshot, default
+#             the bundled one if present), queried with held-out rows
+# A KB with no more rows than PCA_DIM + 1 is projected exactly and proves nothing, so the
+# check also fails if no gated KB is larger than that. The synthetic KB (--rows) is only
+# reported: its vectors are isotropic noise around random intent centres, a worst case
+# for PCA, and show the scoring time and memory saved at scale.
+# Usage: python check_projection.py [--snapshot DIR] [--rows 50000] [--queries 500]
+
+TOP_K = 5
+DIMS = (16, 32, 64, 128)
+
+def copy_index(index):
+    return EmbeddingIndex(index.matrix.copy(), index.tags, index.texts)
+
+def answer(ranked, threshold):
+    return ranked[0][0] if ranked and ranked[0][1] >= threshold else None
+
+def compare(index, queries, dims, threshold, repeat):
+    """Returns {dim: (top-1 agreement, answer agreement)} and prints one row per dim."""
+    reference = [rank_intents(q, index, TOP_K) for q in queries]
+    full_ms = timed_ms(lambda: [rank_intents(q, index, TOP_K) for q in queries[:50]], repeat) / min(50, len(queries))
+    print(f"{'dims':>6}{'variance':>10}{'top-1':>8}{'recall@5':>10}{'answer':>8}{'max err':>9}"
+          f"{'ms/query':>10}{'memory':>8}")
+    print(f"{index.matrix.shape[1]:>6}{1:>10.1%}{1:>8.1%}{1:>10.1%}{1:>8.1%}{0:>9.4f}{full_ms:>10.3f}{1:>8.0%}")
+    agreement = {}
+    for dim in dims:
+        projected = with_projection(copy_index(index), n_components=dim)
+        if projected.projection is None:
+            continue
+        ranked = [rank_intents(q, projected, TOP_K) for q in queries]
+        top1 = np.mean([r[0][0] == p[0][0] for r, p in zip(reference, ranked)])
+        recall = np.mean([len({t for t, _ in r} & {t for t, _ in p}) / len(r) for r, p in zip(reference, ranked)])
+        decided = np.mean([answer(r, threshold) == answer(p, threshold) for r, p in zip(reference, ranked)])
+        error = max(abs(r[0][1] - p[0][1]) for r, p in zip(reference, ranked))
+        single = timed_ms(lambda: [rank_intents(q, projected, TOP_K) for q in queries[:50]], repeat) / min(50, len(queries))
+        memory = projected.matrix.nbytes / index.matrix.nbytes
+        exact = ' (exact)' if projected.projection.output_dim - 1 < dim else ''
+        print(f"{dim:>6}{projected.projection.explained:>10.1%}{top1:>8.1%}{recall:>10.1%}{decided:>8.1%}"
+              f"{error:>9.4f}{single:>10.3f}{memory:>8.0%}{exact}")
+        agreement[dim] = (top1, decided)
+    return agreement
+
+def intents_kb(n_queries, augment, seed=0):
+    """Patterns plus augment paraphrases of each as rows; fresh paraphrases as queries."""
+    rng = random.Random(seed)
+    embedder = LocalEmbeddingProvider()
+    patterns = [(p, i['tag']) for i in load_intents() for p in i['patterns']]
+    rows = patterns + [(paraphrase(p, rng), t) for p, t in patterns for _ in range(augment)]
+    vectors = embedder.embed_batch([p for p, _ in rows]).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = EmbeddingIndex(vectors, [t for _, t in rows], [p for p, _ in rows])
+    texts = [paraphrase(rng.choice(patterns)[0], rng) for _ in range(n_queries)]
+    queries = np.stack([normalize_query(v, index.query_dim) for v in embedder.embed_batch(texts)])
+    return index, queries
+
+def snapshot_kb(snapshot_dir, n_queries, seed=0):
+    """
+    The snapshot's stored float32 rows, minus up to a fifth of them held out as queries.
+    Read straight from embeddings.npy: embedding_index() would apply this environment's
+    PCA_DIM and INDEX_PRECISION, and the baseline must be the unmodified vectors.
+    """
+    snapshot = load_snapshot(snapshot_dir)
+    if snapshot is None:
+        return None, None, None
+    matrix = np.asarray(snapshot.matrix, dtype=np.float32)
+    tags = np.asarray(snapshot.meta['embedding_tags'], dtype=object)
+    held_out = np.random.default_rng(seed).choice(len(matrix), size=min(n_queries, len(matrix) // 5), replace=False)
+    keep = np.setdiff1d(np.arange(len(matrix)), held_out)
+    return EmbeddingIndex(matrix[keep], tags[keep]), matrix[held_out], snapshot.model_id
+
+def main():
+    parser = argparse.ArgumentParser(description='Answer agreement of a PCA-projected embedding index')
+    parser.add_argument('--snapshot', default=SNAPSHOT_DIR, help='build_snapshot.py output to check against')
+    parser.add_argument('--rows', type=int, default=50000, help='synthetic KB size (0 skips it)')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--augment', type=int, default=10, help='paraphrases added per intents.json pattern')
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--tolerance', type=float, default=0.0, help='share of changed answers allowed')
+    args = parser.parse_args()
+    target = int(os.environ.get('PCA_DIM', '0')) or 64
+    dims = sorted(set(DIMS) | {target})
+
+    gated = {}
+    index, queries = intents_kb(args.queries, args.augment)
+    print(f"data/intents.json: {len(index)} rows ({args.augment} paraphrases per pattern), "
+          f"{len(index.intent_tags)} intents, {len(queries)} paraphrased queries (local embedder)")
+    gated['intents'] = (len(index), compare(index, queries, dims, args.threshold, repeat=5))
+
+    if os.path.exists(os.path.join(args.snapshot, 'kb.json')):
+        index, queries, model_id = snapshot_kb(args.snapshot, args.queries)
+        if index is not None:
+            print(f"\nSnapshot {args.snapshot}: {len(index)} rows, {len(index.intent_tags)} intents, "
+                  f"{len(queries)} held-out rows as queries ({model_id})")
+            gated['snapshot'] = (len(index), compare(index, queries, dims, args.threshold, repeat=5))
+    else:
+        print(f"\nNo snapshot at {args.snapshot}; run build_snapshot.py to check the stored embeddings too")
+
+    if args.rows:
+        _, embedding_docs, make_queries = synthetic_kb(args.rows)
+        start = time.perf_counter()
+        index = build_embedding_index(embedding_docs)
+        queries = np.stack([q[1] for q in make_queries(min(args.queries, 200))]).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        print(f"\nSynthetic KB (reported only): {len(index)} rows, {len(index.intent_tags)} intents, "
+              f"{len(queries)} queries (built in {time.perf_counter() - start:.1f}s)")
+        compare(index, queries, dims, args.threshold, repeat=2)
+
+    failures = []
+    for name, (rows, agreement) in gated.items():
+        if rows <= target + 1:
+            print(f"{name}: {rows} rows, PCA_DIM={target} is an exact projection here, not checked")
+            continue
+        if target not in agreement:
+            failures.append(f"{name}: PCA_DIM={target} could not be evaluated "
+                            f"(no projection below the {rows}-row KB's full dimension)")
+            continue
+        top1, decided = agreement[target]
+        if min(top1, decided) < 1 - args.tolerance:
+            failures.append(f"{name}: PCA_DIM={target} changes the top-1 intent of {1 - top1:.1%} "
+                            f"and the answer of {1 - decided:.1%} of the queries")
+    checked = [name for name, (rows, _) in gated.items() if rows > target + 1]
+    if not checked:
+        failures.append(f"no KB has more than {target + 1} rows, so PCA_DIM={target} was never tested")
+    if failures:
+        print('\nFAIL: ' + '\nFAIL: '.join(failures))
+        sys.exit(1)
+    print(f"\nOK: PCA_DIM={target} keeps every answer within {args.tolerance:.1%} on {', '.join(checked)}")
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ from appwrite.client import Client
 from appwrite.services.functions import Functions
 from appwrite.input_file import InputFile
 from dotenv import load_dotenv
+from build_snapshot import build_snapshot
 
 load_dotenv()
 
@@ -23,15 +24,34 @@ functions = Functions(client)
 function_id = 'chatbot_brain'
 path = 'appwrite_functions/chatbot_brain'
 
+def vendor_nltk_data():
+    # The brain never downloads corpora at runtime; ship the Punkt tables it needs
+    import nltk
+    target = os.path.join(path, 'nltk_data')
+    if not nltk.download('punkt_tab', download_dir=target, quiet=True):
+        print("Warning: could not vendor punkt_tab; the brain will tokenize without sentence splitting.")
+
+def exclude_cache(info):
+    return None if '__pycache__' in info.name else info
+
 def create_tar_gz():
+    # The bundle carries src/ plus the KB snapshot written by build_snapshot()
+    if not os.path.exists(os.path.join(path, 'snapshot', 'kb.json')):
+        print("Warning: no KB snapshot in the bundle; cold starts will load the KB live.")
     out = io.BytesIO()
     with tarfile.open(fileobj=out, mode='w:gz') as tar:
-        tar.add(path, arcname='.')
+        tar.add(path, arcname='.', filter=exclude_cache)
     return out.getvalue()
 
 def deploy():
+    vendor_nltk_data()
+    try:
+        build_snapshot()
+    except Exception as e:
+        print(f"Snapshot build failed, deploying without it: {e}")
+
     print(f"Deploying function {function_id}...")
-    
+
     # We need to write the tar.gz to a file because the SDK might expect a file path or InputFile
     tar_data = create_tar_gz()
     with open('code.tar.gz', 'wb') as f:
@@ -0,0 +1,105 @@
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from local_stack import Faults, LocalStack
+from bench_engine import load_intents, paraphrase
+
+# Load test of proxy.py -> chatbot_brain on the local stand-in stack (local_stack.py): the
+# real Flask app and brain, fake Appwrite and a fake HF server with injected latency,
+# errors and quotas. Prints latency percentiles, throughput, status codes and answer
+# methods, and what each fake service saw.
+#
+# Usage: python load_test.py --requests 500 --concurrency 8 --hf-latency-ms 120 --hf-quota 300
+#        python load_test.py --batch 20        (POST /chat/batch with 20 messages each)
+#        python load_test.py --write-every 50  (add a pattern every 50 requests: KB reloads)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load test proxy + brain on the local stack')
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--batch', type=int, default=0, help='messages per /chat/batch call; 0 uses /chat')
+    parser.add_argument('--write-every', type=int, default=0, help='add a pattern every N requests')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write the report as JSON to this file')
+    for service in ('db', 'fn', 'hf'):
+        parser.add_argument(f'--{service}-latency-ms', type=float, default=0.0)
+        parser.add_argument(f'--{service}-jitter-ms', type=float, default=0.0)
+        parser.add_argument(f'--{service}-error-rate', type=float, default=0.0)
+        parser.add_argument(f'--{service}-quota', type=int, default=None, help='calls per --quota-window')
+    parser.add_argument('--quota-window', type=float, default=60.0)
+    return parser.parse_args()
+
+def faults_for(args, service):
+    return Faults(latency_ms=getattr(args, f'{service}_latency_ms'), jitter_ms=getattr(args, f'{service}_jitter_ms'),
+                  error_rate=getattr(args, f'{service}_error_rate'), quota=getattr(args, f'{service}_quota'),
+                  quota_window=args.quota_window, seed=args.seed)
+
+def main():
+    args = parse_args()
+    stack = LocalStack(faults_for(args, 'db'), faults_for(args, 'fn'), faults_for(args, 'hf')).start()
+    rng = random.Random(args.seed)
+    intents = load_intents()
+    questions = [(p, i['tag']) for i in intents for p in i['patterns']]
+    local = threading.local()
+    latencies, statuses, methods = [], Counter(), Counter()
+    lock = threading.Lock()
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = stack.proxy.app.test_client()
+        return local.client
+
+    def one(n):
+        with lock:
+            picked = [rng.choice(questions) for _ in range(max(1, args.batch))]
+            messages = [paraphrase(text, rng) for text, _ in picked]
+        if args.write_every and n and n % args.write_every == 0:
+            tag = rng.choice(intents)['tag']
+            client().post('/data/patterns', json={'text': f'{messages[0]} ({n})', 'intent_tag': tag})
+        start = time.perf_counter()
+        if args.batch:
+            response = client().post('/chat/batch', json={'messages': messages})
+        else:
+            response = client().post('/chat', json={'message': messages[0]})
+        ms = (time.perf_counter() - start) * 1000
+        body = response.get_json(silent=True) or {}
+        answers = body.get('results', [body])
+        with lock:
+            latencies.append(ms)
+            statuses[response.status_code] += 1
+            methods.update(a.get('method', 'error') for a in answers)
+
+    # One warm-up request loads the KB, as the first invocation of a container would
+    one(0)
+    latencies.clear(), statuses.clear(), methods.clear()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(one, range(1, args.requests + 1)))
+    elapsed = time.perf_counter() - started
+    stack.stop()
+
+    values = np.asarray(latencies)
+    report = {
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'messages_per_request': max(1, args.batch),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(args.requests / elapsed, 1),
+        'latency_ms': {f'p{p}': round(float(np.percentile(values, p)), 2) for p in (50, 95, 99)},
+        'status_codes': dict(statuses),
+        'methods': dict(methods),
+        'services': stack.stats(),
+        'logger': dict(stack.brain.query_logger.stats)
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,479 @@
+import os
+import json
+import time
+import uuid
+import random
+import shutil
+import tempfile
+import threading
+import traceback
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from appwrite.exception import AppwriteException
+from appwrite_functions.chatbot_brain.src.embedding_codec import encode_embedding
+from appwrite_functions.chatbot_brain.src.nlp_engine import MODEL_ID, LocalEmbeddingProvider
+
+# In-process stand-ins for the Appwrite Databases/Functions services and the HuggingFace
+# feature-extraction API, so proxy.py and the brain can run end to end (and under load)
+# without the cloud. Every fake takes a Faults to inject latency, errors and 429 quotas.
+# load_test.py drives the whole stack; LocalStack wires it up for any other script.
+
+DB_ID = 'nwu_chatbot_db'
+DEFAULT_LIMIT = 25
+KB_COLLECTIONS = ['intents', 'patterns', 'responses', 'embeddings', 'centroids', 'settings', 'logs']
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+
+class Faults:
+    """
+    How a fake service misbehaves: every call sleeps latency_ms (+ up to jitter_ms), fails
+    with probability error_rate, and is rejected with 429 once quota calls were made in the
+    current quota_window seconds (quota=None: unlimited).
+    """
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, quota=None, quota_window=60.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.quota = quota
+        self.quota_window = quota_window
+        self.stats = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_calls = 0
+
+    def outcome(self):
+        """Waits out the injected latency; returns None, 'rate_limited' or 'error'."""
+        with self._lock:
+            self.stats['calls'] += 1
+            delay = self.latency_ms + (self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+            failed = self.error_rate and self._rng.random() < self.error_rate
+            limited = False
+            if self.quota is not None:
+                now = time.monotonic()
+                if now - self._window_start >= self.quota_window:
+                    self._window_start, self._window_calls = now, 0
+                self._window_calls += 1
+                limited = self._window_calls > self.quota
+        if delay:
+            time.sleep(delay / 1000)
+        if limited:
+            self.stats['rate_limited'] += 1
+            return 'rate_limited'
+        if failed:
+            self.stats['errors'] += 1
+            return 'error'
+        return None
+
+    def check(self):
+        """outcome() raised the way the Appwrite SDK raises"""
+        result = self.outcome()
+        if result == 'rate_limited':
+            raise AppwriteException('Rate limit for the current endpoint has been exceeded.', 429,
+                                    'general_rate_limit_exceeded')
+        if result == 'error':
+            raise AppwriteException('Server Error', 500, 'general_unknown')
+
+# --- Databases ---
+
+def _matches(doc, query):
+    method, attribute, values = query['method'], query.get('attribute'), query.get('values', [])
+    value = doc.get(attribute)
+    if method == 'equal':
+        return value in values
+    if method == 'notEqual':
+        return value not in values
+    if method == 'isNull':
+        return value is None
+    if method == 'isNotNull':
+        return value is not None
+    if value is None:
+        return False
+    if method == 'lessThan':
+        return value < values[0]
+    if method == 'lessThanEqual':
+        return value <= values[0]
+    if method == 'greaterThan':
+        return value > values[0]
+    if method == 'greaterThanEqual':
+        return value >= values[0]
+    if method == 'between':
+        return values[0] <= value <= values[1]
+    if method == 'startsWith':
+        return str(value).startswith(values[0])
+    if method == 'endsWith':
+        return str(value).endswith(values[0])
+    if method == 'contains':
+        if isinstance(value, list):
+            return any(v in value for v in values)
+        return any(str(v) in str(value) for v in values)
+    if method == 'search':
+        # Fulltext approximation: every word of the search appears in the attribute
+        return all(word in str(value).lower() for word in str(values[0]).lower().split())
+    raise AppwriteException(f'Invalid query method: {method}', 400, 'general_query_invalid')
+
+class FakeDatabases:
+    """
+    The slice of appwrite.services.databases.Databases the project uses, on in-memory
+    collections. Documents keep insertion order (Appwrite's default order), list_documents
+    applies filters, ordering, cursors, offset, limit (default 25) and select like the server.
+    """
+
+    def __init__(self, faults=None):
+        self.faults = faults or Faults()
+        self.collections = {}
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def add_collection(self, collection, documents=()):
+        """Creates (or extends) a collection directly, bypassing faults; for seeding."""
+        with self._lock:
+            store = self.collections.setdefault(collection, {})
+            for data in documents:
+                doc = self._new_document(collection, data.get('$id', 'unique()'), data)
+                store[doc['$id']] = doc
+
+    def _call(self, method):
+        self.calls[method] += 1
+        self.faults.check()
+
+    def _collection(self, collection):
+        if collection not in self.collections:
+            raise AppwriteException('Collection with the requested ID could not be found.', 404,
+                                    'collection_not_found')
+        return self.collections[collection]
+
+    def _new_document(self, collection, document_id, data):
+        doc_id = uuid.uuid4().hex[:20] if document_id in (None, 'unique()') else document_id
+        stamp = now_iso()
+        attributes = {k: v for k, v in data.items() if not k.startswith('$')}
+        return dict(attributes, **{'$id': doc_id, '$collectionId': collection, '$databaseId': DB_ID,
+                                   '$createdAt': stamp, '$updatedAt': stamp,
+                                   '$permissions': list(data.get('$permissions', []))})
+
+    def list_documents(self, database_id, collection_id, queries=None, **kwargs):
+        self._call('list_documents')
+        parsed = [json.loads(q) for q in queries or []]
+        with self._lock:
+            docs = list(self._collection(collection_id).values())
+        limit, offset, cursor, select, orders = DEFAULT_LIMIT, 0, None, None, []
+        for query in parsed:
+            method = query['method']
+            if method == 'limit':
+                limit = query['values'][0]
+            elif method == 'offset':
+                offset = query['values'][0]
+            elif method in ('cursorAfter', 'cursorBefore'):
+                cursor = (method, query['values'][0])
+            elif method == 'select':
+                select = query['values']
+            elif method in ('orderAsc', 'orderDesc'):
+                orders.append(query)
+            else:
+                docs = [d for d in docs if _matches(d, query)]
+        for query in reversed(orders):
+            docs.sort(key=lambda d: (d.get(query['attribute']) is None, d.get(query['attribute'])),
+                      reverse=query['method'] == 'orderDesc')
+        total = len(docs)
+        if cursor:
+            ids = [d['$id'] for d in docs]
+            if cursor[1] not in ids:
+                raise AppwriteException(f"Document '{cursor[1]}' for the 'cursor' value not found.", 400,
+                                        'document_not_found')
+            at = ids.index(cursor[1])
+            docs = docs[at + 1:] if cursor[0] == 'cursorAfter' else docs[max(0, at - limit):at]
+        docs = docs[offset:offset + limit]
+        if select:
+            docs = [{k: d[k] for k in select if k in d} for d in docs]
+        else:
+            docs = [dict(d) for d in docs]
+        return {'total': total, 'documents': docs}
+
+    def get_document(self, database_id, collection_id, document_id, queries=None, **kwargs):
+        self._call('get_document')
+        with self._lock:
+            doc = self._collection(collection_id).get(document_id)
+        if doc is None:
+            raise AppwriteException('Document with the requested ID could not be found.', 404, 'document_not_found')
+        return dict(doc)
+
+    def create_document(self, database_id, collection_id, document_id, data, permissions=None, **kwargs):
+        self._call('create_document')
+        return self._insert(collection_id, [dict(data, **{'$id': document_id})])[0]
+
+    def create_documents(self, database_id, collection_id, documents, **kwargs):
+        self._call('create_documents')
+        created = self._insert(collection_id, documents)
+        return {'total': len(created), 'documents': created}
+
+    def _insert(self, collection_id, documents):
+        with self._lock:
+            store = self._collection(collection_id)
+            created = [self._new_document(collection_id, data.get('$id', 'unique()'), data) for data in documents]
+            if any(doc['$id'] in store for doc in created):
+                raise AppwriteException('Document with the requested ID already exists.', 409, 'document_already_exists')
+            for doc in created:
+                store[doc['$id']] = doc
+        return [dict(doc) for doc in created]
+
+    def update_document(self, database_id, collection_id, document_id, data=None, permissions=None, **kwargs):
+        self._call('update_document')
+        with self._lock:
+            doc = self._collection(collection_id).get(document_id)
+            if doc is None:
+                raise AppwriteException('Document with the requested ID could not be found.', 404, 'document_not_found')
+            doc.update({k: v for k, v in (data or {}).items() if not k.startswith('$')})
+            doc['$updatedAt'] = now_iso()
+            return dict(doc)
+
+    def delete_document(self, database_id, collection_id, document_id, **kwargs):
+        self._call('delete_document')
+        with self._lock:
+            if self._collection(collection_id).pop(document_id, None) is None:
+                raise AppwriteException('Document with the requested ID could not be found.', 404, 'document_not_found')
+        return {}
+
+# --- Functions ---
+
+class FakeRequest:
+    def __init__(self, body, headers, path, method):
+        self.body = body or ''
+        self.headers = {k.lower(): v for k, v in (headers or {}).items()}
+        self.path = path or '/'
+        self.method = method or 'POST'
+
+class FakeResponse:
+    def json(self, data, status_code=200, headers=None):
+        return {'body': json.dumps(data), 'statusCode': status_code}
+
+    def text(self, body, status_code=200, headers=None):
+        return {'body': body, 'statusCode': status_code}
+
+    def empty(self):
+        return {'body': '', 'statusCode': 204}
+
+class FakeContext:
+    """What an Appwrite Python runtime hands to main(context)."""
+
+    def __init__(self, body=None, headers=None, path=None, method=None):
+        self.req = FakeRequest(body, headers, path, method)
+        self.res = FakeResponse()
+        self.logs = []
+        self.errors = []
+
+    def log(self, message):
+        self.logs.append(str(message))
+
+    def error(self, message):
+        self.errors.append(str(message))
+
+class FakeFunctions:
+    """
+    Functions.create_execution against entrypoints registered in-process, e.g.
+    FakeFunctions({'chatbot_brain': main}). Executions run in the calling thread (xasync=True:
+    in a background thread, returned as 'waiting' and readable with get_execution).
+    """
+
+    def __init__(self, entrypoints=None, faults=None):
+        self.entrypoints = dict(entrypoints or {})
+        self.faults = faults or Faults()
+        self.executions = {}
+        self.calls = Counter()
+
+    def create_execution(self, function_id, body=None, xasync=None, path=None, method=None, headers=None,
+                         scheduled_at=None):
+        self.calls['create_execution'] += 1
+        self.faults.check()
+        if function_id not in self.entrypoints:
+            raise AppwriteException('Function with the requested ID could not be found.', 404, 'function_not_found')
+        execution = {
+            '$id': uuid.uuid4().hex[:20], '$createdAt': now_iso(), 'functionId': function_id,
+            'trigger': 'http', 'status': 'waiting', 'requestMethod': str(method or 'POST'),
+            'requestPath': path or '/', 'responseStatusCode': 0, 'responseBody': '',
+            'logs': '', 'errors': '', 'duration': 0.0
+        }
+        self.executions[execution['$id']] = execution
+        context = FakeContext(body, headers, path, str(method or 'POST'))
+        if xasync:
+            threading.Thread(target=self._run, args=(execution, context), daemon=True).start()
+            return dict(execution)
+        self._run(execution, context)
+        return dict(execution)
+
+    def _run(self, execution, context):
+        started = time.perf_counter()
+        execution['status'] = 'processing'
+        try:
+            response = self.entrypoints[execution['functionId']](context)
+            execution.update(status='completed', responseStatusCode=response['statusCode'],
+                             responseBody=response['body'])
+        except Exception:
+            # Appwrite reports a crashed function as failed, with an empty body
+            context.error(traceback.format_exc())
+            execution.update(status='failed', responseStatusCode=500)
+        execution.update(logs='\n'.join(context.logs), errors='\n'.join(context.errors),
+                         duration=round(time.perf_counter() - started, 4))
+
+    def get_execution(self, function_id, execution_id):
+        self.calls['get_execution'] += 1
+        return dict(self.executions[execution_id])
+
+# --- HuggingFace feature extraction ---
+
+class FakeHFServer:
+    """
+    HTTP server speaking the feature-extraction protocol InferenceClient uses:
+    POST {"inputs": str | [str]} -> a vector or a list of vectors. Vectors come from the
+    local hashed n-gram embedder, so paraphrases score close as they would with MiniLM.
+    Injected errors answer 503, exhausted quotas 429 with Retry-After.
+    """
+
+    def __init__(self, faults=None, dim=384, token=None, port=0):
+        self.faults = faults or Faults()
+        self.embedder = LocalEmbeddingProvider(dim=dim)
+        self.token = token
+        self.stats = Counter()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-hf', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def reply(self, status, payload, headers=()):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                fake.stats['requests'] += 1
+                raw = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if fake.token and self.headers.get('Authorization') != f'Bearer {fake.token}':
+                    return self.reply(401, {'error': 'Invalid credentials in Authorization header'})
+                outcome = fake.faults.outcome()
+                if outcome == 'rate_limited':
+                    return self.reply(429, {'error': 'Rate limit reached. Please retry later.'},
+                                      [('Retry-After', str(int(fake.faults.quota_window)))])
+                if outcome == 'error':
+                    return self.reply(503, {'error': 'Service Unavailable'})
+                try:
+                    inputs = json.loads(raw)['inputs']
+                except (ValueError, KeyError, TypeError):
+                    return self.reply(400, {'error': 'Expected {"inputs": ...}'})
+                if isinstance(inputs, list):
+                    fake.stats['texts'] += len(inputs)
+                    return self.reply(200, fake.embedder.embed_batch(inputs).tolist())
+                fake.stats['texts'] += 1
+                return self.reply(200, fake.embedder.embed(inputs).tolist())
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+# --- Wiring ---
+
+def seed_from_intents(databases, embedder, path='data/intents.json', model_id=MODEL_ID):
+    """Loads data/intents.json into the fake collections the way setup + backfill would."""
+    with open(path, encoding='utf-8') as f:
+        intents = json.load(f)['intents']
+    for collection in KB_COLLECTIONS:
+        databases.add_collection(collection)
+    patterns = [{'text': p, 'intent_tag': i['tag']} for i in intents for p in i['patterns']]
+    vectors = embedder.embed_batch([p['text'] for p in patterns])
+    databases.add_collection('intents', [{'tag': i['tag'], 'description': ''} for i in intents])
+    databases.add_collection('patterns', patterns)
+    databases.add_collection('responses', [{'text': r, 'intent_tag': i['tag']} for i in intents for r in i['responses']])
+    databases.add_collection('embeddings', [
+        {'intent_tag': p['intent_tag'], 'pattern_text': p['text'], 'model': model_id,
+         'embedding': encode_embedding(vector, 'f16')}
+        for p, vector in zip(patterns, vectors)
+    ])
+    databases.add_collection('settings', [{'key': 'threshold', 'value': '0.5'},
+                                          {'key': 'kb_version', 'value': str(time.time_ns())}])
+
+class LocalStack:
+    """
+    Fake Appwrite + fake HF with the real brain and proxy on top:
+
+        stack = LocalStack(hf_faults=Faults(latency_ms=80)).start()
+        client = stack.proxy.app.test_client()
+        client.post('/chat', json={'message': 'when are exams'})
+
+    start() points the brain's client lookup at the fake, and swaps the proxy's
+    module-level services for the fakes. The brain's disk query cache and log spool go
+    to a fresh temp dir, removed by stop(), so a run never answers from an earlier run's
+    cached embeddings and the HF faults always apply.
+    """
+
+    def __init__(self, db_faults=None, functions_faults=None, hf_faults=None, intents_path='data/intents.json'):
+        self.databases = FakeDatabases(db_faults)
+        self.functions = FakeFunctions(faults=functions_faults)
+        self.hf = FakeHFServer(hf_faults, token='local-stack')
+        self.intents_path = intents_path
+        self.brain = None
+        self.proxy = None
+        self.workdir = None
+
+    def start(self):
+        self.hf.start()
+        self.workdir = tempfile.mkdtemp(prefix='local_stack_')
+        os.environ.update({'QUERY_CACHE_DIR': os.path.join(self.workdir, 'query_cache'),
+                           'LOG_SPOOL_PATH': os.path.join(self.workdir, 'query_logs.jsonl')})
+        os.environ.update({'EMBEDDING_BACKEND': 'hf', 'HF_ENDPOINT_URL': self.hf.url, 'HF_API_TOKEN': self.hf.token})
+        for name, value in (('APPWRITE_ENDPOINT', 'http://127.0.0.1/v1'), ('APPWRITE_PROJECT_ID', 'local'),
+                            ('APPWRITE_API_KEY', 'local')):
+            os.environ.setdefault(name, value)
+        seed_from_intents(self.databases, self.hf.embedder, self.intents_path)
+
+        from appwrite_functions.chatbot_brain.src import main as brain
+        brain.get_databases = lambda endpoint, project, key=None: self.databases
+        # main may have been imported before start(), with the default /tmp locations
+        brain.query_cache = brain.QueryEmbeddingCache.from_env()
+        brain.query_logger.spool_path = os.environ['LOG_SPOOL_PATH']
+        self.brain = brain
+        self.functions.entrypoints['chatbot_brain'] = brain.main
+
+        import proxy
+        proxy.databases = self.databases
+        proxy.functions = self.functions
+        proxy.embedding_provider = brain.get_provider()
+        self.proxy = proxy
+        return self
+
+    def stop(self):
+        self.hf.stop()
+        if self.brain is not None:
+            self.brain.query_logger.flush()
+        if self.workdir is not None:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            self.workdir = None
+
+    def stats(self):
+        return {
+            'databases': dict(self.databases.calls, **{f'faults_{k}': v for k, v in self.databases.faults.stats.items()}),
+            'functions': dict(self.functions.calls, **{f'faults_{k}': v for k, v in self.functions.faults.stats.items()}),
+            'hf': dict(self.hf.stats, **{f'faults_{k}': v for k, v in self.hf.faults.stats.items()})
+        }
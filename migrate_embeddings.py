@@ -0,0 +1,52 @@
+import os
+import sys
+from appwrite.client import Client
+from appwrite.services.databases import Databases
+from dotenv import load_dotenv
+from appwrite_functions.chatbot_brain.src.embedding_codec import encode_embedding, decode_embedding, is_binary, parse_header
+from appwrite_functions.chatbot_brain.src.kb_loader import iter_documents
+
+load_dotenv()
+
+# Re-encodes stored embeddings in place, e.g. legacy JSON text -> base64 float16.
+# Usage: python migrate_embeddings.py [f16|f32|json] [--dry-run]
+endpoint = os.getenv('APPWRITE_ENDPOINT')
+project_id = os.getenv('APPWRITE_PROJECT_ID')
+api_key = os.getenv('APPWRITE_API_KEY')
+database_id = os.getenv('APPWRITE_DATABASE_ID', 'nwu_chatbot_db')
+
+client = Client()
+client.set_endpoint(endpoint)
+client.set_project(project_id)
+client.set_key(api_key)
+
+databases = Databases(client)
+
+def current_encoding(text):
+    if is_binary(text):
+        return parse_header(text)[0]
+    return 'json'
+
+def migrate_embeddings(target='f16', dry_run=False):
+    print(f"Fetching embeddings to re-encode as {target}...")
+    # Documents are streamed page by page; updating one does not move the $id cursor
+    migrated = skipped = failed = 0
+    for doc in iter_documents(databases, database_id, 'embeddings', select=['embedding', 'pattern_text']):
+        if current_encoding(doc['embedding']) == target:
+            skipped += 1
+            continue
+        try:
+            encoded = encode_embedding(decode_embedding(doc['embedding']), target)
+            if not dry_run:
+                databases.update_document(database_id, 'embeddings', doc['$id'], {'embedding': encoded})
+            migrated += 1
+        except Exception as e:
+            print(f"Error re-encoding {doc['$id']} ({doc.get('pattern_text')}): {e}")
+            failed += 1
+
+    action = "Would migrate" if dry_run else "Migrated"
+    print(f"{action} {migrated}, already {target}: {skipped}, failed: {failed} (of {migrated + skipped + failed})")
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    migrate_embeddings(args[0] if args else 'f16', dry_run='--dry-run' in sys.argv)
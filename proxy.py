@@ -1,14 +1,18 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from appwrite.client import Client
 from appwrite.services.functions import Functions
 from appwrite.services.account import Account
 from appwrite.services.databases import Databases
 from appwrite.query import Query
-from huggingface_hub import InferenceClient
 import os
 import json
+import time
 from dotenv import load_dotenv
+from appwrite_functions.chatbot_brain.src.embedding_codec import encode_embedding, decode_embedding
+from appwrite_functions.chatbot_brain.src.centroids import shift_centroid
+from appwrite_functions.chatbot_brain.src.clients import get_client
+from appwrite_functions.chatbot_brain.src.kb_loader import list_all_documents
+from appwrite_functions.chatbot_brain.src.nlp_engine import get_embedding_provider
 
 load_dotenv()
 
@@ -20,15 +24,15 @@ endpoint = os.getenv('APPWRITE_ENDPOINT')
 project_id = os.getenv('APPWRITE_PROJECT_ID')
 api_key = os.getenv('APPWRITE_API_KEY')
 hf_token = os.getenv('HF_API_TOKEN')
+embedding_encoding = os.getenv('EMBEDDING_ENCODING', 'f16')
 
-client = Client()
-client.set_endpoint(endpoint)
-client.set_project(project_id)
-client.set_key(api_key)
+# Pooled keep-alive connections, shared with the key-less client that logs users in
+client = get_client(endpoint, project_id, api_key)
 
 functions = Functions(client)
 databases = Databases(client)
-hf_client = InferenceClient(model="sentence-transformers/all-MiniLM-L6-v2", token=hf_token)
+# EMBEDDING_BACKEND must match the brain's so stored and query vectors are comparable
+embedding_provider = get_embedding_provider(os.getenv('EMBEDDING_BACKEND'), hf_token)
 
 DB_ID = 'nwu_chatbot_db'
 COLL_INTENTS = 'intents'
@@ -36,20 +40,70 @@ COLL_PATTERNS = 'patterns'
 COLL_RESPONSES = 'responses'
 COLL_LOGS = 'logs'
 COLL_EMBEDDINGS = 'embeddings'
+COLL_SETTINGS = 'settings'
+COLL_CENTROIDS = 'centroids'
+KB_VERSION_KEY = 'kb_version'
+# Messages per brain execution for /chat/batch (the brain accepts up to BATCH_MAX_MESSAGES)
+CHAT_BATCH_SIZE = int(os.getenv('CHAT_BATCH_SIZE', '100'))
+
+def bump_kb_version():
+    # The brain caches settings, indexes and responses until this marker changes
+    try:
+        version = str(time.time_ns())
+        docs = databases.list_documents(DB_ID, COLL_SETTINGS, [Query.equal('key', KB_VERSION_KEY)])
+        if docs['documents']:
+            databases.update_document(DB_ID, COLL_SETTINGS, docs['documents'][0]['$id'], {'value': version})
+        else:
+            databases.create_document(DB_ID, COLL_SETTINGS, 'unique()', {'key': KB_VERSION_KEY, 'value': version})
+    except Exception as e:
+        print(f"KB version bump error: {e}")
+
+def update_intent_centroid(tag, vector, sign=1, model_id=None):
+    # Running mean of an intent's pattern vectors, the brain's first retrieval stage.
+    # Adding or removing one pattern is O(1); no other embedding has to be read.
+    model_id = model_id or embedding_provider.model_id
+    try:
+        docs = databases.list_documents(DB_ID, COLL_CENTROIDS, [
+            Query.equal('intent_tag', tag),
+            Query.equal('model', model_id)
+        ])['documents']
+        doc = docs[0] if docs else None
+        mean, count = shift_centroid(
+            decode_embedding(doc['embedding']) if doc else None, doc['count'] if doc else 0, vector, sign
+        )
+        if mean is None:
+            if doc:
+                databases.delete_document(DB_ID, COLL_CENTROIDS, doc['$id'])
+        elif doc:
+            databases.update_document(DB_ID, COLL_CENTROIDS, doc['$id'], {
+                'embedding': encode_embedding(mean, 'f32'),
+                'count': count
+            })
+        else:
+            databases.create_document(DB_ID, COLL_CENTROIDS, 'unique()', {
+                'intent_tag': tag,
+                'model': model_id,
+                'embedding': encode_embedding(mean, 'f32'),
+                'count': count
+            })
+    except Exception as e:
+        # The brain recomputes a centroid whose count disagrees with the patterns
+        print(f"Centroid update error ({tag}): {e}")
 
 def generate_and_store_embedding(text, tag):
     try:
-        vector = hf_client.feature_extraction(text)
-        if hasattr(vector, 'tolist'):
-            vector = vector.tolist()
-        
+        vector = embedding_provider.embed(text)
+        encoded = encode_embedding(vector, embedding_encoding)
+
         databases.create_document(DB_ID, COLL_EMBEDDINGS, 'unique()', {
             'intent_tag': tag,
             'pattern_text': text,
-            'embedding': json.dumps(vector),
-            'model': "sentence-transformers/all-MiniLM-L6-v2"
+            'embedding': encoded,
+            'model': embedding_provider.model_id
         })
         print(f"Stored semantic embedding for: {text}")
+        # Use the stored (possibly float16) vector so a later delete subtracts exactly what was added
+        update_intent_centroid(tag, decode_embedding(encoded))
     except Exception as e:
         print(f"Embedding generation error: {e}")
 
@@ -80,14 +134,44 @@ def chat():
         print(f"ERROR: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    # {"messages": [...]} -> {"results": [...]} in the same order; each execution of the
+    # brain answers up to CHAT_BATCH_SIZE messages with one embedding call and one log write
+    data = request.json or {}
+    messages = data.get('messages')
+    if not isinstance(messages, list) or not messages:
+        return jsonify({"error": "No messages provided"}), 400
+    results = []
+    try:
+        for i in range(0, len(messages), CHAT_BATCH_SIZE):
+            chunk = messages[i:i + CHAT_BATCH_SIZE]
+            execution = functions.create_execution(
+                function_id='chatbot_brain',
+                body=json.dumps({"messages": chunk})
+            )
+            if not execution['responseBody']:
+                return jsonify({"error": "Brain returned empty response", "status": execution['status'],
+                                "results": results}), 500
+            body = json.loads(execution['responseBody'])
+            if 'results' not in body:
+                # Pass the brain's own status through: a 400 means the messages were invalid
+                status = execution.get('responseStatusCode') or 500
+                return jsonify(dict(body, results=results)), status if 400 <= status < 600 else 500
+            results.extend(body['results'])
+        return jsonify({"results": results})
+    except Exception as e:
+        print(f"ERROR: {str(e)}")
+        return jsonify({"error": str(e), "results": results}), 500
+
 @app.route('/login', methods=['POST'])
 def login():
     data = request.json
     email = data.get('email')
     password = data.get('password')
     try:
-        user_client = Client().set_endpoint(endpoint).set_project(project_id)
-        user_account = Account(user_client)
+        # No key and no cookies are kept on this client, so one serves every login
+        user_account = Account(get_client(endpoint, project_id))
         session = user_account.create_email_password_session(email, password)
         return jsonify({"status": "success", "session": session})
     except Exception as e:
@@ -97,8 +181,9 @@ def login():
 def get_stats():
     try:
         logs = databases.list_documents(DB_ID, COLL_LOGS, [Query.limit(100), Query.order_desc('$createdAt')])
-        intents = databases.list_documents(DB_ID, COLL_INTENTS)
-        return jsonify({"logs": logs, "intents": intents})
+        # Every intent, not Appwrite's default first page of 25
+        intents = list_all_documents(databases, DB_ID, COLL_INTENTS)
+        return jsonify({"logs": logs, "intents": {"total": len(intents), "documents": intents}})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -107,11 +192,15 @@ def handle_data(collection):
     try:
         if request.method == 'GET':
             query_tag = request.args.get('tag')
-            queries = [Query.limit(100)]
+            queries = []
             if query_tag:
                 queries.append(Query.equal('intent_tag', query_tag))
-            result = databases.list_documents(DB_ID, collection, queries)
-            return jsonify(result)
+            if collection == COLL_LOGS:
+                # Logs grow without bound; the admin panel only needs a page of them
+                result = databases.list_documents(DB_ID, collection, [*queries, Query.limit(100)])
+                return jsonify(result)
+            documents = list_all_documents(databases, DB_ID, collection, queries)
+            return jsonify({"total": len(documents), "documents": documents})
         
         if request.method == 'POST':
             data = request.json
@@ -120,7 +209,9 @@ def handle_data(collection):
             # If adding a new pattern, also generate embedding
             if collection == COLL_PATTERNS:
                 generate_and_store_embedding(data.get('text'), data.get('intent_tag'))
-                
+
+            if collection != COLL_LOGS:
+                bump_kb_version()
             return jsonify(result)
             
         if request.method == 'DELETE':
@@ -129,35 +220,34 @@ def handle_data(collection):
             if collection == COLL_INTENTS:
                 intent = databases.get_document(DB_ID, COLL_INTENTS, doc_id)
                 tag = intent['tag']
-                # Delete patterns
-                p_docs = databases.list_documents(DB_ID, COLL_PATTERNS, [Query.equal('intent_tag', tag)])
-                for doc in p_docs['documents']:
-                    databases.delete_document(DB_ID, COLL_PATTERNS, doc['$id'])
-                # Delete responses
-                r_docs = databases.list_documents(DB_ID, COLL_RESPONSES, [Query.equal('intent_tag', tag)])
-                for doc in r_docs['documents']:
-                    databases.delete_document(DB_ID, COLL_RESPONSES, doc['$id'])
-                # Delete embeddings
-                e_docs = databases.list_documents(DB_ID, COLL_EMBEDDINGS, [Query.equal('intent_tag', tag)])
-                for doc in e_docs['documents']:
-                    databases.delete_document(DB_ID, COLL_EMBEDDINGS, doc['$id'])
+                # Delete patterns, responses, embeddings and centroids; every page is listed
+                # before deleting, since removing a document would invalidate the cursor
+                for related in (COLL_PATTERNS, COLL_RESPONSES, COLL_EMBEDDINGS, COLL_CENTROIDS):
+                    docs = list_all_documents(databases, DB_ID, related, [Query.equal('intent_tag', tag)], select=['$id'])
+                    for doc in docs:
+                        databases.delete_document(DB_ID, related, doc['$id'])
             
             # If deleting a specific pattern, delete its embedding too
             if collection == COLL_PATTERNS:
                 pattern = databases.get_document(DB_ID, COLL_PATTERNS, doc_id)
-                e_docs = databases.list_documents(DB_ID, COLL_EMBEDDINGS, [
+                e_docs = list_all_documents(databases, DB_ID, COLL_EMBEDDINGS, [
                     Query.equal('intent_tag', pattern['intent_tag']),
                     Query.equal('pattern_text', pattern['text'])
-                ])
-                for doc in e_docs['documents']:
+                ], select=['intent_tag', 'embedding', 'model'])
+                for doc in e_docs:
                     databases.delete_document(DB_ID, COLL_EMBEDDINGS, doc['$id'])
+                    update_intent_centroid(doc['intent_tag'], decode_embedding(doc['embedding']), -1, doc.get('model'))
 
             databases.delete_document(DB_ID, collection, doc_id)
+            if collection != COLL_LOGS:
+                bump_kb_version()
             return jsonify({"status": "deleted"})
 
         if request.method == 'PUT':
             doc_id = request.args.get('id')
             result = databases.update_document(DB_ID, collection, doc_id, request.json)
+            if collection != COLL_LOGS:
+                bump_kb_version()
             return jsonify(result)
 
     except Exception as e:
@@ -106,6 +106,12 @@ def setup_database():
             print("Collection created.")
         except Exception as e:
             print(f"Collection logs error: {e}")
+    # Per-stage timings of each request (JSON); added to existing logs collections too
+    try:
+        databases.create_string_attribute(database_id, 'logs', 'timings', 2000, False)
+        print("Added logs.timings attribute.")
+    except Exception as e:
+        print(f"logs.timings attribute: {e}")
 
     # 5. Settings Collection
     print(f"Checking collection: settings...")
@@ -125,6 +131,8 @@ def setup_database():
             import time
             time.sleep(2)
             databases.create_document(database_id, 'settings', 'unique()', {'key': 'threshold', 'value': '0.75'})
+            # Bumped by proxy.py on every KB edit; the brain drops its caches when it changes
+            databases.create_document(database_id, 'settings', 'unique()', {'key': 'kb_version', 'value': '1'})
         except Exception as e:
             print(f"Collection settings error: {e}")
 
@@ -147,6 +155,25 @@ def setup_database():
         except Exception as e:
             print(f"Collection embeddings error: {e}")
 
+    # 7. Centroids Collection (mean embedding per intent, maintained by proxy.py)
+    print(f"Checking collection: centroids...")
+    try:
+        databases.get_collection(database_id, 'centroids')
+        print("Collection already exists.")
+    except Exception:
+        try:
+            databases.create_collection(database_id, 'centroids', 'centroids', permissions=[
+                Permission.read(Role.any()),
+                Permission.write(Role.users()), 
+            ])
+            databases.create_string_attribute(database_id, 'centroids', 'intent_tag', 50, True)
+            databases.create_string_attribute(database_id, 'centroids', 'embedding', 10000, True)
+            databases.create_string_attribute(database_id, 'centroids', 'model', 100, True)
+            databases.create_integer_attribute(database_id, 'centroids', 'count', True)
+            print("Collection created.")
+        except Exception as e:
+            print(f"Collection centroids error: {e}")
+
 def migrate_data():
     with open('data/intents.json', 'r') as f:
         data = json.load(f)
@@ -0,0 +1,89 @@
+import os
+import sys
+import subprocess
+
+# Cold-start import cost of each chatbot_brain module, measured with `python -X importtime`
+# in a fresh interpreter per module. Fails when a module exceeds its budget so heavy
+# imports (nltk, huggingface_hub) don't creep back onto the first-response path.
+# Usage: python test_import_budget.py   (or run under pytest)
+
+PACKAGE = 'appwrite_functions.chatbot_brain.src'
+BUDGETS_MS = {
+    'embedding_codec': 250,
+    'ann_index': 250,
+    'query_cache': 250,
+    'query_log': 50,
+    'nlp_engine': 250,
+    'projection': 250,
+    'snapshot': 250,
+    'kb_loader': 250,
+    'timing': 50,
+    'circuit_breaker': 50,
+    'clients': 1200,
+    'kb_cache': 400,
+    'main': 1500,
+}
+# Must stay out of the import graph of the request entrypoint
+LAZY_MODULES = ['nltk', 'huggingface_hub.inference._client']
+SCALE = float(os.getenv('IMPORT_BUDGET_SCALE', '1.0'))
+
+def measure(module):
+    """
+    Returns ({imported module: cumulative microseconds}, {direct dependency: cumulative
+    microseconds}, total milliseconds) for one module imported in a fresh interpreter.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {PACKAGE}.{module}'],
+        cwd=root, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    cumulative = {}
+    direct = {}
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, raw_name = line.split('|', 2)
+        name = raw_name.strip()
+        depth = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+        cumulative[name] = int(cumulative_us)
+        # importtime prints children before their parent
+        if depth == 1:
+            children.append((name, int(cumulative_us)))
+        elif depth == 0:
+            if name.startswith('appwrite_functions'):
+                direct.update(children)
+            children = []
+    return cumulative, direct, cumulative.get(f'{PACKAGE}.{module}', 0) / 1000
+
+def report():
+    failures = []
+    print(f"{'module':<18}{'ms':>9}{'budget':>9}  heaviest dependencies")
+    for module, budget in BUDGETS_MS.items():
+        cumulative, direct, total_ms = measure(module)
+        heaviest = sorted(direct.items(), key=lambda item: item[1], reverse=True)[:3]
+        deps = ', '.join(f"{name} {us / 1000:.0f}ms" for name, us in heaviest)
+        limit = budget * SCALE
+        flag = '' if total_ms <= limit else '  OVER BUDGET'
+        print(f"{module:<18}{total_ms:>9.1f}{limit:>9.0f}  {deps}{flag}")
+        if total_ms > limit:
+            failures.append(f"{module}: {total_ms:.0f}ms > {limit:.0f}ms")
+        if module == 'main':
+            for lazy in LAZY_MODULES:
+                if lazy in cumulative:
+                    failures.append(f"main imports {lazy} eagerly")
+    return failures
+
+def test_import_budget():
+    failures = report()
+    assert not failures, '; '.join(failures)
+
+if __name__ == "__main__":
+    problems = report()
+    if problems:
+        print("\n".join(problems))
+        sys.exit(1)
+    print("All modules within their import budget.")